@@ -0,0 +1,166 @@
+import argparse
+import random
+import socket
+
+import numpy as np
+
+from SchiffeVersenkenAnalytics import Profile
+from SchiffeVersenkenEngine import CLIENT_FLEET, DEFAULT_FLEET, GameConfig, fleet_sampler, format_positions
+from SchiffeVersenkenProtocol import BINARY, TEXT, MessageStream
+
+TARGET_WEIGHT = 100  # Placements through known hits count this much more per hit
+
+
+def placement_density(blocked, hits, length):
+    # For every cell: weighted number of horizontal placements of a ship of this length covering it
+    rows, cols = blocked.shape
+    if length > cols:
+        return np.zeros(blocked.shape)
+    pad = np.zeros((rows, 1), dtype=np.int64)
+    blocked_sums = np.cumsum(np.hstack((pad, blocked)), axis=1)
+    hit_sums = np.cumsum(np.hstack((pad, hits)), axis=1)
+    # Sliding window sums: blocked and hit cells under a ship starting at every column
+    window_blocked = blocked_sums[:, length:] - blocked_sums[:, :-length]
+    window_hits = hit_sums[:, length:] - hit_sums[:, :-length]
+    weights = (window_blocked == 0) * (1 + TARGET_WEIGHT * window_hits)
+    # Spread each placement over the cells it covers with a second sliding window sum
+    weight_sums = np.cumsum(np.hstack((pad, weights)), axis=1)
+    columns = np.arange(cols)
+    last_start = np.minimum(columns, cols - length) + 1
+    first_start = np.maximum(columns - length + 1, 0)
+    return weight_sums[:, last_start] - weight_sums[:, first_start]
+
+
+class ProbabilityStrategy:
+    # Fires where the most legal placements of the remaining ships overlap, given known hits and misses
+    name = "probability"
+
+    def __init__(self, size, rng, fleet=DEFAULT_FLEET, prior=None):
+        self.size = size
+        self.rng = rng
+        self.prior = prior  # Optional per-cell weights, e.g. Profile.target_prior() from recorded games
+        self.ship_sizes = {name: ship_size for ship_size, name in fleet}
+        self.remaining = [ship_size for ship_size, _ in fleet]
+        self.blocked = np.zeros((size, size), dtype=np.int64)  # Misses and sunk ships
+        self.hits = np.zeros((size, size), dtype=np.int64)  # Hits on ships that are still afloat
+        self.shot = np.zeros((size, size), dtype=bool)
+
+    def density(self):
+        density = np.zeros((self.size, self.size))
+        for length in set(self.remaining):
+            count = self.remaining.count(length)
+            density += count * placement_density(self.blocked, self.hits, length)
+            density += count * placement_density(self.blocked.T, self.hits.T, length).T
+        if self.prior is not None:
+            density *= self.prior
+        density[self.shot] = 0
+        return density
+
+    def next_shot(self):
+        density = self.density()
+        best = density.max()
+        if best <= 0:
+            candidates = np.flatnonzero(~self.shot)
+        else:
+            candidates = np.flatnonzero(density == best)
+        return divmod(int(candidates[self.rng.randrange(len(candidates))]), self.size)
+
+    def observe(self, row, col, hit, sunk):
+        self.shot[row, col] = True
+        if not hit:
+            self.blocked[row, col] = 1
+            return
+        self.hits[row, col] = 1
+        length = self.ship_sizes.get(sunk)
+        if length is not None and length in self.remaining:
+            self.remaining.remove(length)
+            self.mark_sunk(row, col, length)
+
+    def mark_sunk(self, row, col, length):
+        # Moves the sunk ship from the hits to the blocked cells when its run of hits is unambiguous
+        runs = []
+        for dr, dc in ((0, 1), (1, 0)):
+            run = [(row, col)]
+            for step in (1, -1):
+                r, c = row + dr * step, col + dc * step
+                while 0 <= r < self.size and 0 <= c < self.size and self.hits[r, c]:
+                    run.append((r, c))
+                    r, c = r + dr * step, c + dc * step
+            if len(run) == length:
+                runs.append(run)
+        if length == 1:
+            runs = [[(row, col)]]
+        if len(runs) == 1:
+            for r, c in runs[0]:
+                self.hits[r, c] = 0
+                self.blocked[r, c] = 1
+
+
+class AIClient:
+    # Headless player for BattleshipServer: random fleet, shots from ProbabilityStrategy.
+    # size and fleet are only the defaults, the CONFIG sent by the server replaces them
+    def __init__(self, host='192.168.5.143', port=5555, size=10, fleet=CLIENT_FLEET, binary=False, seed=None,
+                 profiles=None):
+        self.rng = random.Random(seed)
+        # {board size: Profile} of recorded games: aims at popular ship cells, hides in rarely shot ones
+        self.profiles = profiles or {}
+        self.client = socket.create_connection((host, port))
+        self.stream = MessageStream()
+        if binary:
+            self.client.sendall(TEXT.encode("ENCODING", (BINARY.name,)))
+            self.stream.send_codec = BINARY
+        self.configure(GameConfig(size, fleet))
+        self.shots = 0
+        self.won = None
+
+    def configure(self, config):
+        profile = self.profiles.get(config.size)
+        sampler = fleet_sampler(tuple(config.fleet), config.size, config.adjacent)
+        if profile:
+            self.strategy = ProbabilityStrategy(config.size, self.rng, config.fleet, profile.target_prior())
+            self.ships = profile.safest_fleet(sampler, self.rng)
+        else:
+            self.strategy = ProbabilityStrategy(config.size, self.rng, config.fleet)
+            self.ships = sampler.sample(self.rng)
+
+    def play(self):
+        while self.won is None:
+            messages = self.stream.recv(self.client)
+            if messages is None:
+                break
+            for kind, fields in messages:
+                self.handle_message(kind, fields)
+        self.client.close()
+        return self.won
+
+    def handle_message(self, kind, fields):
+        if kind == "ENCODING":
+            self.stream.codec = BINARY if fields[0] == BINARY.name else TEXT
+        elif kind == "CONFIG":
+            self.configure(GameConfig.from_text(fields[0]))
+            self.client.sendall(self.stream.encode("SHIP_POSITIONS", format_positions(self.ships)))
+        elif kind == "TURN" and fields[0] == "YES":
+            row, col = self.strategy.next_shot()
+            self.shots += 1
+            self.client.sendall(self.stream.encode("GUESS", row, col))
+        elif kind == "RESULT":
+            self.strategy.observe(int(fields[0]), int(fields[1]), fields[2] == "HIT", None)
+        elif kind == "WIN":
+            self.won = fields[0] == "YES"
+        elif kind == "PING":
+            self.client.sendall(self.stream.encode("PONG"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Computer player for the Schiffe versenken server")
+    parser.add_argument("--host", default='192.168.5.143')
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--profile", default=None, help="analytics JSON written by SchiffeVersenkenAnalytics.py --out")
+    args = parser.parse_args()
+
+    profiles = Profile.load(args.profile) if args.profile else None
+    ai = AIClient(args.host, args.port, binary=args.binary, seed=args.seed, profiles=profiles)
+    won = ai.play()
+    print(f"{'Won' if won else 'Lost'} after {ai.shots} shots")
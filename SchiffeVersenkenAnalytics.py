@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from SchiffeVersenkenEngine import GameConfig
+from SchiffeVersenkenEventLog import (CHECKPOINT, END, FLEET, MATCH, SHOT, SNAPSHOT, MatchState, find_record, open_log,
+                                      read_records, unpack_fleet_event, unpack_shot_event)
+
+FLUSH_EVERY = 1 << 16  # Cell indices gathered in lists before they are added to the NumPy counts
+CHUNK = 1 << 24  # Smallest byte range of an archive worth a task of its own
+
+
+def finished_matches(path, start=0, end=None):
+    # Generator over a byte range of one archive: (size, fleets, shots, winner) for every match with a recorded
+    # winner whose MATCH record starts in the range, or that the segment carried over from the one before in its
+    # head. Reading goes on past the end until those matches are over; records of matches begun before the range
+    # are skipped. The archive is memory-mapped and read record by record, only matches still in play are held
+    # in memory
+    buffer = open_log(path)
+    end = len(buffer) if end is None else end
+    pos = find_record(buffer, start) if start else 0
+    in_head = pos == 0  # Still in the CHECKPOINT and SNAPSHOT records a segment opens with
+    in_play = {}  # match id -> [size, fleets, [(player, row, col), ...]]
+    for kind, match_id, payload, after in read_records(buffer, pos):
+        owned = pos < end  # Matches begun after the end belong to the next range
+        pos = after
+        if not owned and not in_play:
+            break
+        if kind == CHECKPOINT:
+            continue
+        if kind == SNAPSHOT:
+            if in_head and owned:
+                state = MatchState.from_snapshot(match_id, payload)
+                shots = [(1 - player, row, col) for player in (0, 1) for row, col in state.game.boards[player].shots]
+                in_play[match_id] = [state.config.size, list(state.fleets), shots]
+            continue
+        in_head = False
+        if kind == MATCH:
+            if owned:
+                in_play[match_id] = [GameConfig.from_text(bytes(payload).decode()).size, [None, None], []]
+            continue
+        match = in_play.get(match_id)
+        if match is None:
+            continue
+        if kind == FLEET:
+            player, ships = unpack_fleet_event(payload)
+            match[1][player] = ships
+        elif kind == SHOT:
+            match[2].append(unpack_shot_event(payload))
+        elif kind == END:
+            del in_play[match_id]
+            if payload[0] in (0, 1) and all(match[1]):
+                yield match[0], match[1], match[2], payload[0]
+
+
+class Heatmaps:
+    # Per-cell shot, hit and ship counts plus the shots-to-win distribution for one board size
+    def __init__(self, size):
+        self.size = size
+        cells = size * size
+        self.games = 0
+        self.shots = np.zeros(cells, dtype=np.int64)
+        self.hits = np.zeros(cells, dtype=np.int64)
+        self.placement = np.zeros(cells, dtype=np.int64)
+        self.shots_to_win = np.zeros(cells + 1, dtype=np.int64)
+        self.pending_shots = []
+        self.pending_hits = []
+        self.pending_ships = []
+        self.pending_wins = []
+
+    def add(self, fleets, shots, winner):
+        size = self.size
+        occupied = [{row * size + col for cells in fleet for row, col in cells} for fleet in fleets]
+        for cells in occupied:
+            self.pending_ships.extend(cells)
+        winner_shots = 0
+        for player, row, col in shots:
+            index = row * size + col
+            self.pending_shots.append(index)
+            if index in occupied[1 - player]:
+                self.pending_hits.append(index)
+            winner_shots += player == winner
+        self.pending_wins.append(min(winner_shots, size * size))
+        self.games += 1
+        if len(self.pending_shots) > FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        cells = self.size * self.size
+        self.shots += np.bincount(self.pending_shots, minlength=cells)
+        self.hits += np.bincount(self.pending_hits, minlength=cells)
+        self.placement += np.bincount(self.pending_ships, minlength=cells)
+        self.shots_to_win += np.bincount(self.pending_wins, minlength=cells + 1)
+        self.pending_shots, self.pending_hits, self.pending_ships, self.pending_wins = [], [], [], []
+
+    def merge(self, other):
+        self.flush()
+        other.flush()
+        self.games += other.games
+        self.shots += other.shots
+        self.hits += other.hits
+        self.placement += other.placement
+        self.shots_to_win += other.shots_to_win
+
+    def to_json(self):
+        self.flush()
+        grid = (self.size, self.size)
+        wins = {int(shots): int(count) for shots, count in enumerate(self.shots_to_win) if count}
+        return {
+            "size": self.size,
+            "games": self.games,
+            "shots": self.shots.reshape(grid).tolist(),
+            "hits": self.hits.reshape(grid).tolist(),
+            "placement": self.placement.reshape(grid).tolist(),
+            "shots_to_win": wins,
+        }
+
+
+def collect(matches):
+    by_size = {}
+    for size, fleets, shots, winner in matches:
+        heatmaps = by_size.get(size)
+        if heatmaps is None:
+            heatmaps = by_size[size] = Heatmaps(size)
+        heatmaps.add(fleets, shots, winner)
+    for heatmaps in by_size.values():
+        heatmaps.flush()
+    return by_size
+
+
+def analyze_range(path, start, end):
+    return collect(finished_matches(path, start, end))
+
+
+def byte_ranges(paths, parts, chunk=CHUNK):
+    # (path, start, end) pieces of the archives, about parts of them but none smaller than chunk bytes
+    sizes = [(path, os.path.getsize(path)) for path in paths]
+    piece = max(chunk, sum(size for _, size in sizes) // parts + 1)
+    return [(path, start, min(start + piece, size)) for path, size in sizes for start in range(0, size, piece)]
+
+
+def analyze(paths, workers=1, chunk=CHUNK):
+    # The archives are cut into byte ranges, a few per worker so a slow range does not hold up the rest;
+    # each worker reads only its ranges plus the ends of the matches begun in them
+    pieces = byte_ranges(paths, workers * 4, chunk)
+    if workers <= 1 or len(pieces) <= 1:
+        return collect(match for path in paths for match in finished_matches(path))
+    total = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for by_size in pool.map(analyze_range, *zip(*pieces)):
+            for size, heatmaps in by_size.items():
+                if size in total:
+                    total[size].merge(heatmaps)
+                else:
+                    total[size] = heatmaps
+    return total
+
+
+class Profile:
+    # Heatmaps of one board size loaded from the analytics output, for the AI and the random fleet buttons
+    def __init__(self, size, shots, hits, placement, shots_to_win=None):
+        self.size = size
+        self.shots = np.asarray(shots, dtype=float)
+        self.hits = np.asarray(hits, dtype=float)
+        self.placement = np.asarray(placement, dtype=float)
+        self.shots_to_win = shots_to_win or {}
+
+    @classmethod
+    def load(cls, path):
+        # {board size: Profile} from the JSON written with --out
+        with open(path) as f:
+            data = json.load(f)
+        return {int(size): cls(entry["size"], entry["shots"], entry["hits"], entry["placement"], entry["shots_to_win"])
+                for size, entry in data.items()}
+
+    def target_prior(self):
+        # Weight between 1 and 2 per cell: cells where players like to put ships are worth a closer look
+        top = self.placement.max()
+        return 1 + self.placement / top if top else np.ones_like(self.placement)
+
+    def exposure(self, ships):
+        # How often opponents fired at the cells of this fleet
+        return sum(self.shots[row, col] for cells in ships for row, col in cells)
+
+    def safest_fleet(self, sampler, rng=random, blocked=0, candidates=32):
+        # Of a few random legal fleets, the one on the cells opponents shoot least
+        best, best_exposure = None, None
+        for _ in range(candidates):
+            ships = sampler.sample(rng, blocked)
+            if ships is None:
+                return best
+            exposure = self.exposure(ships)
+            if best is None or exposure < best_exposure:
+                best, best_exposure = ships, exposure
+        return best
+
+
+def print_heatmap(counts):
+    # Shades from " " (never) to "#" (most often)
+    shades = " .:-=+*%#"
+    top = counts.max() or 1
+    for row in counts:
+        print("".join(shades[int(value / top * (len(shades) - 1))] * 2 for value in row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Heatmaps and statistics over recorded Schiffe versenken games")
+    parser.add_argument("archives", nargs="+",
+                        help="event logs written with --event-log and their closed segments FILE.1, FILE.2, ...")
+    parser.add_argument("--workers", type=int, default=1, help="processes scanning the archives, 0 for one per core")
+    parser.add_argument("--out", default=None, help="write the profile as JSON for --profile of the players")
+    args = parser.parse_args()
+
+    results = analyze(args.archives, args.workers or os.cpu_count())
+    for size, heatmaps in sorted(results.items()):
+        wins = np.repeat(np.arange(len(heatmaps.shots_to_win)), heatmaps.shots_to_win)
+        print(f"{size}x{size}: {heatmaps.games} games, shots to win mean {wins.mean():.1f}, "
+              f"median {np.median(wins):.0f}, p90 {np.percentile(wins, 90):.0f}")
+        hit_rate = heatmaps.hits.sum() / max(1, heatmaps.shots.sum())
+        print(f"hit rate {hit_rate:.1%}; shots, then ship placement:")
+        print_heatmap(heatmaps.shots.reshape(size, size))
+        print()
+        print_heatmap(heatmaps.placement.reshape(size, size))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({str(size): heatmaps.to_json() for size, heatmaps in results.items()}, f)
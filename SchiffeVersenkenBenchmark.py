@@ -0,0 +1,323 @@
+import argparse
+import functools
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from SchiffeVersenkenEngine import DEFAULT_FLEET, Board, Game, GameConfig, fleet_sampler, format_positions
+from SchiffeVersenkenProtocol import BINARY, TEXT, MessageStream
+from SchiffeVersenkenSimulation import play_game, strategy as load_strategy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_SCRIPT = os.path.join(HERE, "SchiffeVersenkenServer .py")
+SIZES = (10, 20, 50)
+
+# What a player socket sees during a game, for the codec benchmarks
+MESSAGES = [
+    ("GUESS", (3, 7)),
+    ("RESULT", (3, 7, "HIT")),
+    ("TURN", ("YES",)),
+    ("HIT_ON_SHIP", (4, 2)),
+    ("MISS_ON_SHIP", (9, 0)),
+    ("TURN", ("NO",)),
+    ("SHIP_POSITIONS", ("0:0,1:0,2:0,3:0;0:2,1:2,2:2;0:4,1:4;0:6",)),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def load_server():
+    # The server script's name has a space in it, so it is loaded from its path
+    spec = importlib.util.spec_from_file_location("SchiffeVersenkenServer", SERVER_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sized_fleet(size):
+    # The TK fleet once per 10x10 area, so larger boards are about as crowded as the classic one
+    return DEFAULT_FLEET * max(1, (size // 10) ** 2)
+
+
+def shot_orders(size, rng):
+    cells = [(row, col) for row in range(size) for col in range(size)]
+    orders = []
+    for _ in range(2):
+        rng.shuffle(cells)
+        orders.append(list(cells))
+    return orders
+
+
+# Every benchmark builds its inputs once and returns run(), which does a batch of work and returns how many
+# operations that was; the rate is operations per second
+
+def encode(codec):
+    def setup():
+        def run():
+            for kind, fields in MESSAGES:
+                codec.encode(kind, fields)
+            return len(MESSAGES)
+        return run
+    return setup
+
+
+def decode(codec):
+    def setup():
+        data = b"".join(codec.encode(kind, fields) for kind, fields in MESSAGES) * 16
+        stream = MessageStream()
+        stream.codec = codec
+
+        def run():
+            count = 0
+            for _ in stream.feed(data):
+                count += 1
+            return count
+        return run
+    return setup
+
+
+def placement(size):
+    # can_place_line + add_ship at random spots until the fleet is on the board
+    def setup():
+        rng = random.Random(size)
+        fleet = sized_fleet(size)
+        spots = [(rng.randrange(size), rng.randrange(size), rng.random() < 0.5) for _ in range(4096)]
+
+        def run():
+            board = Board(size)
+            tries = 0
+            for length, name in fleet:
+                while True:
+                    row, col, vertical = spots[tries % len(spots)]
+                    tries += 1
+                    if board.can_place_line(row, col, length, vertical):
+                        board.add_ship([(row + i, col) if vertical else (row, col + i) for i in range(length)], name)
+                        break
+            return tries
+        return run
+    return setup
+
+
+def sunk(size):
+    # Board.shoot on every ship cell, ship by ship, so each ship ends in a sunk check
+    def setup():
+        fleet = sized_fleet(size)
+        ships = fleet_sampler(tuple(fleet), size).sample(random.Random(size))
+
+        def run():
+            board = Board(size)
+            for cells in ships:
+                board.add_ship(cells)
+            for cells in ships:
+                for row, col in cells:
+                    board.shoot(row, col)
+            return sum(len(cells) for cells in ships)
+        return run
+    return setup
+
+
+def game_shots(size):
+    # Game.shoot, turn order and win check, over whole games with the fleets placed anew each game
+    def setup():
+        rng = random.Random(size)
+        fleet = sized_fleet(size)
+        sampler = fleet_sampler(tuple(fleet), size)
+        fleets = [sampler.sample(rng), sampler.sample(rng)]
+        orders = shot_orders(size, rng)
+
+        def run():
+            game = Game(size)
+            game.place_fleet(0, fleets[0])
+            game.place_fleet(1, fleets[1])
+            fired = [0, 0]
+            while game.winner is None:
+                player = game.current_player
+                row, col = orders[player][fired[player]]
+                fired[player] += 1
+                game.shoot(player, row, col)
+            return fired[0] + fired[1]
+        return run
+    return setup
+
+
+def server_match(size):
+    # Match.handle_message for both fleets and every GUESS of a match, replies encoded but not sent
+    def setup():
+        server = load_server()
+        rng = random.Random(size)
+        config = GameConfig(size, sized_fleet(size))
+        sampler = fleet_sampler(tuple(config.fleet), size)
+        positions = [format_positions(sampler.sample(rng)), format_positions(sampler.sample(rng))]
+        guesses = [[[str(row), str(col)] for row, col in order] for order in shot_orders(size, rng)]
+
+        class Player:
+            # Stands in for a Connection: replies are encoded as usual and dropped
+            def __init__(self):
+                self.stream = MessageStream()
+
+            def send(self, kind, *fields):
+                self.stream.queue(kind, *fields)
+                if len(self.stream.pending) > 64:
+                    self.stream.pending.clear()
+
+        def run():
+            match = server.Match(1, config)
+            match.join(Player())
+            match.join(Player())
+            match.handle_message(0, "SHIP_POSITIONS", [positions[0]])
+            match.handle_message(1, "SHIP_POSITIONS", [positions[1]])
+            fired = [0, 0]
+            while not match.finished:
+                player = match.game.current_player
+                match.handle_message(player, "GUESS", guesses[player][fired[player]])
+                fired[player] += 1
+            return 2 + fired[0] + fired[1]
+        return run
+    return setup
+
+
+def simulation(size, strategy="hunt"):
+    # Whole headless games between two strategies, the same loop as SchiffeVersenkenSimulation
+    def setup():
+        fleet = sized_fleet(size)
+        strategies = [load_strategy(strategy), load_strategy(strategy)]
+        seeds = itertools.count()
+
+        def run():
+            play_game(strategies, fleet, size, next(seeds))
+            return 1
+        return run
+    return setup
+
+
+BENCHMARKS = {
+    "protocol.encode.text": encode(TEXT),
+    "protocol.encode.binary": encode(BINARY),
+    "protocol.decode.text": decode(TEXT),
+    "protocol.decode.binary": decode(BINARY),
+}
+for size in SIZES:
+    BENCHMARKS[f"engine.placement.{size}x{size}"] = placement(size)
+    BENCHMARKS[f"engine.sunk.{size}x{size}"] = sunk(size)
+    BENCHMARKS[f"engine.game.{size}x{size}"] = game_shots(size)
+    BENCHMARKS[f"server.match.{size}x{size}"] = server_match(size)
+    BENCHMARKS[f"simulation.game.{size}x{size}"] = simulation(size)
+
+
+def measure(run, seconds, repeat):
+    # Best of `repeat` rounds of about `seconds` each, in operations per second; the best round is the one
+    # least disturbed by the rest of the machine
+    run()
+    best = 0.0
+    for _ in range(repeat):
+        operations = 0
+        start = time.perf_counter()
+        while True:
+            operations += run()
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+        best = max(best, operations / elapsed)
+    return best
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(names, seconds=0.2, repeat=5, progress=None):
+    results = {}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name](), seconds, repeat)
+        if progress:
+            progress(name, results[name])
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.node()} {platform.machine()}",
+        "results": results,
+    }
+
+
+def compare(run, baseline, threshold):
+    # (name, rate, baseline rate or None, relative change, flag) per benchmark; flag is REGRESSION when the
+    # rate dropped by more than threshold, faster when it rose by more
+    rows = []
+    for name, rate in run["results"].items():
+        before = baseline["results"].get(name) if baseline else None
+        change = rate / before - 1 if before else None
+        flag = ""
+        if change is not None and change < -threshold:
+            flag = "REGRESSION"
+        elif change is not None and change > threshold:
+            flag = "faster"
+        rows.append((name, rate, before, change, flag))
+    return rows
+
+
+def append_history(path, run):
+    # One JSON object per line, so runs from several machines and commits can simply be appended
+    with open(path, "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the Schiffe versenken hot paths, no display needed")
+    parser.add_argument("patterns", nargs="*", help="only benchmarks whose name contains one of these")
+    parser.add_argument("--seconds", type=float, default=0.2, help="length of one measuring round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark, the best one counts")
+    parser.add_argument("--history", default=os.path.join(HERE, "bench_history.jsonl"),
+                        help="every run is appended here, empty to keep no history")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "bench_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="make this run the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown that counts as a regression")
+    parser.add_argument("--list", action="store_true", help="print the benchmark names and exit")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.patterns or any(p in name for p in args.patterns)]
+    if args.list:
+        print("\n".join(names))
+        sys.exit(0)
+
+    baseline = load_json(args.baseline)
+    run = run_benchmarks(names, args.seconds, args.repeat,
+                         lambda name, rate: print(f"{name:<32}{rate:>14,.0f} /s", file=sys.stderr))
+    if args.history:
+        append_history(args.history, run)
+
+    print(f"{'benchmark':<32}{'ops/sec':>14}{'baseline':>14}{'change':>9}")
+    rows = compare(run, baseline, args.threshold)
+    for name, rate, before, change, flag in rows:
+        before_text = f"{before:>14,.0f}" if before else f"{'-':>14}"
+        change_text = f"{change:>+8.1%}" if change is not None else f"{'-':>8}"
+        print(f"{name:<32}{rate:>14,.0f}{before_text} {change_text}  {flag}")
+
+    if args.save_baseline:
+        if baseline:
+            # Benchmarks left out of this run keep their old baseline
+            run["results"] = dict(baseline["results"], **run["results"])
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=1)
+        print(f"Baseline saved to {args.baseline}")
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
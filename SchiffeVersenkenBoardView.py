@@ -0,0 +1,80 @@
+import tkinter as tk
+
+
+class ButtonBoard:
+    # One tk.Button per cell, fine for the classic 10x10 board
+    def __init__(self, master, size, on_click):
+        self.size = size
+        self.enabled = True
+        self.buttons = []
+        for row in range(size):
+            button_row = []
+            for col in range(size):
+                button = tk.Button(master, width=2, height=1, command=lambda r=row, c=col: on_click(r, c))
+                button.grid(row=row, column=col)
+                button_row.append(button)
+            self.buttons.append(button_row)
+
+    def set_color(self, row, col, color):
+        self.buttons[row][col].config(bg=color)
+
+    def disable(self, row, col):
+        self.buttons[row][col].config(state='disabled')
+
+    def set_enabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        for button_row in self.buttons:
+            for button in button_row:
+                button.config(state='normal' if enabled else 'disabled')
+
+
+class CanvasBoard:
+    # The whole board on a single tk.Canvas: clicks are resolved by coordinate math and only
+    # cells whose color changes are touched, so 100x100 boards cost the same per update as 10x10
+    def __init__(self, master, size, on_click, cell_size=None, background="#d9d9d9"):
+        self.size = size
+        self.cell_size = cell_size or max(4, min(24, 600 // size))
+        self.on_click = on_click
+        self.background = background
+        self.enabled = True
+        self.colors = {}  # (row, col) -> color currently drawn
+        self.items = {}  # (row, col) -> rectangle, created the first time a cell gets a color
+        self.disabled = set()
+        extent = size * self.cell_size
+        self.canvas = tk.Canvas(master, width=extent, height=extent, background=background, highlightthickness=0)
+        for i in range(size + 1):
+            offset = i * self.cell_size
+            self.canvas.create_line(offset, 0, offset, extent, fill="gray")
+            self.canvas.create_line(0, offset, extent, offset, fill="gray")
+        self.canvas.bind("<Button-1>", self.click)
+        self.canvas.grid(row=0, column=0, columnspan=size)
+
+    def click(self, event):
+        if not self.enabled:
+            return
+        row, col = event.y // self.cell_size, event.x // self.cell_size
+        if 0 <= row < self.size and 0 <= col < self.size and (row, col) not in self.disabled:
+            self.on_click(row, col)
+
+    def set_color(self, row, col, color):
+        if self.colors.get((row, col)) == color:
+            return
+        self.colors[(row, col)] = color
+        item = self.items.get((row, col))
+        if item is None:
+            x, y = col * self.cell_size, row * self.cell_size
+            self.items[(row, col)] = self.canvas.create_rectangle(
+                x + 1, y + 1, x + self.cell_size - 1, y + self.cell_size - 1, fill=color, width=0)
+        else:
+            self.canvas.itemconfigure(item, fill=color)
+
+    def disable(self, row, col):
+        self.disabled.add((row, col))
+
+    def set_enabled(self, enabled):
+        # A single widget call, whatever the board size
+        if enabled != self.enabled:
+            self.enabled = enabled
+            self.canvas.config(cursor="" if enabled else "watch")
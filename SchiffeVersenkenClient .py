@@ -1,42 +1,78 @@
+import argparse
+import queue
 import socket
 import threading
+import time
 import tkinter as tk
 from tkinter import messagebox
 
+from SchiffeVersenkenBoardView import ButtonBoard, CanvasBoard
+from SchiffeVersenkenEngine import GameConfig, fleet_sampler, format_positions, mask_cells, parse_positions
+from SchiffeVersenkenProtocol import BINARY, INVALID_GUESS, TEXT, MessageStream
+
 class BattleshipClient:
-    def __init__(self, host='192.168.5.143', port=5555):
+    def __init__(self, host='192.168.5.143', port=5555, binary=False, canvas=False, debug_timing=False, profiles=None):
         print("Initializing BattleshipClient...")
-        self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.client.connect((host, port))
+        self.address = (host, port)
+        self.binary = binary
+        # The Tk thread sends guesses while the receiver thread answers PINGs and reconnects
+        self.send_lock = threading.Lock()
+        self.connect()
+        # Token from SESSION and the number of shot results seen, RESUME:<token>:<seq> after a dropped connection
+        self.session = None
+        self.seq = 0
+        self.resuming = False
+        self.game_over = False
 
         self.player_id = None
         self.player_color = None
         self.opponent_ship_positions = []
         self.is_my_turn = False
-        self.grid_size = 10
-        self.ship_sizes = [4, 3, 2, 1]
-        self.ship_names = ["Flugzeugträger", "Kreuzer", "Schiff", "Fischerboot"]
+        self.fired = set()  # Cells of the guess board that already have a RESULT
+        # Replaced by the CONFIG the server sends right after WELCOME
+        self.config = GameConfig()
+        self.grid_size = self.config.size
+        self.ship_sizes = [size for size, _ in self.config.fleet]
+        self.ship_names = [name for _, name in self.config.fleet]
         self.current_ship_index = 0
         self.all_ship_positions = []
+        self.board = self.config.new_board()
+        # {board size: Profile} from recorded games, the random fleet then avoids the most shot cells
+        self.profiles = profiles or {}
+        # A single Canvas per board instead of one Button per cell, for large boards
+        self.board_view = CanvasBoard if canvas else ButtonBoard
+        # Network messages wait here until the Tk main loop picks them up, widgets are never touched from the receiver thread
+        self.inbox = queue.SimpleQueue()
+        self.poll_interval = 15
+        self.debug_timing = debug_timing
 
-        threading.Thread(target=self.receive_messages).start()
+        threading.Thread(target=self.receive_messages, daemon=True).start()
 
         self.window = tk.Tk()
         self.window.title("Battleship - Place Your Ships")
 
         self.create_widgets()
         self.create_guess_window()
+        self.window.after(self.poll_interval, self.drain_messages)
         self.window.mainloop()
 
+    def connect(self):
+        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        client.connect(self.address)
+        stream = MessageStream()
+        if self.binary:
+            # Ask for the compact encoding, the server switches as soon as it reads this line
+            client.sendall(TEXT.encode("ENCODING", (BINARY.name,)))
+            stream.send_codec = BINARY
+        with self.send_lock:
+            self.client, self.stream = client, stream
+
+    def send(self, kind, *fields):
+        with self.send_lock:
+            self.client.sendall(self.stream.encode(kind, *fields))
+
     def create_widgets(self):
-        self.buttons = []
-        for row in range(self.grid_size):
-            button_row = []
-            for col in range(self.grid_size):
-                button = tk.Button(self.window, width=2, height=1, command=lambda r=row, c=col: self.place_ship(r, c))
-                button.grid(row=row, column=col)
-                button_row.append(button)
-            self.buttons.append(button_row)
+        self.ship_board = self.board_view(self.window, self.grid_size, self.place_ship)
 
         self.info_label = tk.Label(self.window, text=f"Place your {self.ship_names[self.current_ship_index]} of size {self.ship_sizes[self.current_ship_index]}")
         self.info_label.grid(row=self.grid_size, column=0, columnspan=self.grid_size)
@@ -44,30 +80,72 @@ class BattleshipClient:
         self.turn_label = tk.Label(self.window, text="")
         self.turn_label.grid(row=self.grid_size + 1, column=0, columnspan=self.grid_size)
 
+        self.random_button = tk.Button(self.window, text="Random fleet", command=self.place_random_fleet)
+        self.random_button.grid(row=self.grid_size + 2, column=0, columnspan=self.grid_size)
+
     def create_guess_window(self):
         self.guess_window = tk.Toplevel(self.window)
         self.guess_window.title("Battleship - Guessing Board")
 
-        self.guess_buttons = []
-        for row in range(self.grid_size):
-            button_row = []
-            for col in range(self.grid_size):
-                button = tk.Button(self.guess_window, width=2, height=1, command=lambda r=row, c=col: self.make_guess(r, c))
-                button.grid(row=row, column=col)
-                button_row.append(button)
-            self.guess_buttons.append(button_row)
+        self.guess_board = self.board_view(self.guess_window, self.grid_size, self.make_guess)
+
+    def apply_config(self, config, rebuild=False):
+        # Size, fleet and touching rule come from the server; the boards are rebuilt and placement starts over
+        rebuild = rebuild or self.current_ship_index > 0 or config.size != self.grid_size
+        self.config = config
+        self.grid_size = config.size
+        self.ship_sizes = [size for size, _ in config.fleet]
+        self.ship_names = [name for _, name in config.fleet]
+        self.current_ship_index = 0
+        self.all_ship_positions = []
+        self.board = config.new_board()
+        if rebuild:
+            for widget in self.window.winfo_children():
+                widget.destroy()
+            self.create_widgets()
+            self.create_guess_window()
+        else:
+            self.info_label.config(text=f"Place your {self.ship_names[0]} of size {self.ship_sizes[0]}")
 
     def place_ship(self, row, col):
+        if self.current_ship_index >= len(self.ship_sizes):
+            return
         ship_size = self.ship_sizes[self.current_ship_index]
-        if row + ship_size > self.grid_size:
+        # Vertical if it fits, else horizontal; one mask test against all ships placed so far
+        if self.board.can_place_line(row, col, ship_size, True):
+            self.ship_positions = [(row + i, col) for i in range(ship_size)]
+        elif self.board.can_place_line(row, col, ship_size, False):
+            self.ship_positions = [(row, col + i) for i in range(ship_size)]
+        else:
             messagebox.showerror("Error", f"Cannot place {self.ship_names[self.current_ship_index]} here.")
             return
+        self.place_cells(self.ship_positions)
 
-        self.ship_positions = [(row + i, col) for i in range(ship_size)]
-        for r, c in self.ship_positions:
-            self.buttons[r][c].config(bg=self.player_color, state='disabled')
+    def place_random_fleet(self):
+        # Fills in every ship not placed yet around the ones already on the board
+        remaining = tuple(self.config.fleet[self.current_ship_index:])
+        if not remaining:
+            return
+        sampler = fleet_sampler(remaining, self.grid_size, self.config.adjacent)
+        profile = self.profiles.get(self.grid_size)
+        if profile:
+            ships = profile.safest_fleet(sampler, blocked=self.board.blocked)
+        else:
+            ships = sampler.sample(blocked=self.board.blocked)
+        if ships is None:
+            messagebox.showerror("Error", "The remaining ships do not fit next to the ones placed.")
+            return
+        for cells in ships:
+            self.place_cells(cells)
+
+    def place_cells(self, cells):
+        self.ship_positions = cells
+        for r, c in cells:
+            self.ship_board.set_color(r, c, self.player_color)
+            self.ship_board.disable(r, c)
 
         self.all_ship_positions.extend(self.ship_positions)
+        self.board.add_ship(self.ship_positions, self.ship_names[self.current_ship_index])
         self.current_ship_index += 1
 
         if self.current_ship_index < len(self.ship_sizes):
@@ -75,89 +153,196 @@ class BattleshipClient:
         else:
             self.info_label.config(text="All ships placed! Waiting for other player...")
             self.send_ship_positions()
-            for row in self.buttons:
-                for button in row:
-                    button.config(state='disabled')
+            self.ship_board.set_enabled(False)
+            self.random_button.config(state='disabled')
 
     def send_ship_positions(self):
-        positions_str = ",".join([f"{r}:{c}" for r, c in self.all_ship_positions])
+        positions_str = format_positions(self.board.positions)
         print(f"Sending ship positions to server: {positions_str}")
-        self.client.sendall(f"SHIP_POSITIONS:{positions_str}\n".encode())
+        self.send("SHIP_POSITIONS", positions_str)
 
     def receive_messages(self):
-        buffer = ""
         while True:
             try:
-                buffer += self.client.recv(1024).decode()
-                while '\n' in buffer:
-                    msg, buffer = buffer.split('\n', 1)
-                    self.handle_message(msg)
-            except Exception as e:
+                messages = self.stream.recv(self.client)
+            except OSError as e:
+                print(f"Error: {e}")
+                messages = None
+            if messages is None:
+                if self.session is None or self.game_over or not self.reconnect():
+                    break
+                continue
+            for kind, fields in messages:
+                if kind == "ENCODING":
+                    # Must take effect before the next bytes are decoded, so it is not queued
+                    self.stream.codec = BINARY if fields[0] == BINARY.name else TEXT
+                elif kind == "PING":
+                    self.send("PONG")
+                elif self.resuming and kind == "ERROR":
+                    # The seat is gone, e.g. the connection dropped before the game started: join a new game
+                    print(f"Could not resume the game: {fields[0]}")
+                    self.resuming = False
+                    self.session = None
+                    self.seq = 0
+                    self.game_over = False
+                    self.inbox.put(("RESUME_FAILED", fields, time.perf_counter()))
+                    if not self.reconnect(resume=False):
+                        return
+                    break  # The rest came over the old connection
+                elif self.resuming and kind != "RESUMED":
+                    continue  # Greeting of the lobby seat the new connection got, not our game
+                else:
+                    self.resuming = False
+                    if kind in ("RESULT", "HIT_ON_SHIP", "MISS_ON_SHIP"):
+                        self.seq += 1
+                    elif kind == "RESYNC":
+                        self.seq = int(fields[0].split("|")[0])
+                    elif kind == "SESSION":
+                        self.session = fields[0]
+                    elif kind == "WIN":
+                        self.game_over = True
+                    self.inbox.put((kind, fields, time.perf_counter()))
+
+    def reconnect(self, resume=True):
+        # Retries with growing pauses, then asks for our seat back with everything seen so far, or joins anew
+        delay = 0.5
+        while delay <= 16:
+            print(f"Connection lost, reconnecting in {delay} s...")
+            time.sleep(delay)
+            try:
+                self.connect()
+            except OSError as e:
                 print(f"Error: {e}")
-                break
+                delay *= 2
+                continue
+            if resume:
+                self.resuming = True
+                self.send("RESUME", f"{self.session}:{self.seq}")
+            return True
+        return False
+
+    def drain_messages(self):
+        batch = []
+        try:
+            while True:
+                batch.append(self.inbox.get_nowait())
+        except queue.Empty:
+            pass
+        if batch:
+            self.process_batch(batch)
+        self.window.after(self.poll_interval, self.drain_messages)
 
-    def handle_message(self, msg):
-        if msg.startswith("PLAYER_ID:"):
-            self.player_id = int(msg.split(":")[1])
+    def process_batch(self, batch):
+        # Only the last TURN of a burst decides whose turn it is, the earlier flips are never drawn
+        last_turn = None
+        for i, (kind, _, _) in enumerate(batch):
+            if kind == "TURN":
+                last_turn = i
+        for i, (kind, fields, _) in enumerate(batch):
+            if kind != "TURN" or i == last_turn:
+                self.handle_message(kind, fields)
+        if self.debug_timing:
+            self.window.update_idletasks()
+            now = time.perf_counter()
+            latencies = [(now - received) * 1000 for _, _, received in batch]
+            print(f"UI batch of {len(batch)}: receive to draw {sum(latencies) / len(latencies):.1f} ms mean, {max(latencies):.1f} ms max")
+
+    def handle_message(self, kind, fields):
+        if kind == "PLAYER_ID":
+            self.player_id = int(fields[0])
             print(f"Set player_id to {self.player_id}")
-        elif msg.startswith("COLOR:"):
-            self.player_color = msg.split(":")[1]
+        elif kind == "COLOR":
+            self.player_color = fields[0]
             print(f"Set player_color to {self.player_color}")
-        elif msg.startswith("WELCOME:"):
-            print(msg)
-        elif msg.startswith("OPPONENT_SHIP_POSITIONS:"):
-            self.opponent_ship_positions = [tuple(map(int, pos.split(":"))) for pos in msg[len("OPPONENT_SHIP_POSITIONS:"):].split(",")]
+        elif kind == "WELCOME":
+            print(f"{kind}:{fields[0]}")
+        elif kind == "CONFIG":
+            self.apply_config(GameConfig.from_text(fields[0]))
+            print(f"Board {self.grid_size}x{self.grid_size}, ships {self.ship_sizes}")
+        elif kind == "SESSION":
+            print(f"Session {fields[0]}")
+        elif kind == "RESUME_FAILED":
+            messagebox.showinfo("Connection lost", f"Could not get back into the game ({fields[0]}), joining a new one")
+            self.is_my_turn = False
+            self.fired = set()
+            self.opponent_ship_positions = []
+            self.apply_config(self.config, rebuild=True)
+        elif kind == "RESUMED":
+            self.player_id = int(fields[0])
+            print(f"Resumed as player {self.player_id + 1}")
+        elif kind == "RESYNC":
+            self.apply_resync(fields[0])
+        elif kind == "OPPONENT":
+            self.turn_label.config(text="Opponent lost the connection, waiting for them..." if fields[0] == "DISCONNECTED"
+                                   else "Opponent is back")
+        elif kind == "ERROR" and fields[0] == INVALID_GUESS:
+            print("Server refused the guess")  # The TURN right behind it hands the turn back
+        elif kind == "ERROR":
+            messagebox.showerror("Error", f"Server rejected the ships: {fields[0]}")
+            self.apply_config(self.config)
+        elif kind == "OPPONENT_SHIP_POSITIONS":
+            ships = parse_positions(fields[0])
+            self.opponent_ship_positions = [pos for cells in ships for pos in cells]
             print(f"Received opponent's ship positions: {self.opponent_ship_positions}")
-        elif msg.startswith("TURN:"):
-            self.is_my_turn = True if msg.split(":")[1] == "YES" else False
+        elif kind == "TURN":
+            self.is_my_turn = True if fields[0] == "YES" else False
             print(f"Set is_my_turn to {self.is_my_turn}")
             self.update_guess_window()
             self.turn_label.config(text="It's your turn!" if self.is_my_turn else "Waiting for your turn...")
-        elif msg.startswith("RESULT:"):
-            self.process_result(msg[len("RESULT:"):])
-        elif msg.startswith("HIT_ON_SHIP:"):
-            self.mark_hit_on_ship(msg[len("HIT_ON_SHIP:"):])
-        elif msg.startswith("MISS_ON_SHIP:"):
-            self.mark_miss_on_ship(msg[len("MISS_ON_SHIP:"):])
-        elif msg.startswith("WIN:"):
-            self.process_win(msg[len("WIN:"):])
+        elif kind == "RESULT":
+            self.process_result(fields)
+        elif kind == "HIT_ON_SHIP":
+            self.mark_hit_on_ship(fields)
+        elif kind == "MISS_ON_SHIP":
+            self.mark_miss_on_ship(fields)
+        elif kind == "WIN":
+            self.process_win(fields[0])
         else:
-            print(msg)
+            print(f"{kind}:{':'.join(map(str, fields))}")
 
     def update_guess_window(self):
-        if self.is_my_turn:
-            for row in self.guess_buttons:
-                for button in row:
-                    button.config(state='normal')
-        else:
-            for row in self.guess_buttons:
-                for button in row:
-                    button.config(state='disabled')
+        self.guess_board.set_enabled(self.is_my_turn)
 
     def make_guess(self, row, col):
-        if self.is_my_turn:
+        if self.is_my_turn and (row, col) not in self.fired:
             print(f"Making guess: ({row}, {col})")
-            self.client.sendall(f"GUESS:{row}:{col}\n".encode())
+            self.send("GUESS", row, col)
             self.is_my_turn = False
             self.turn_label.config(text="Waiting for your turn...")
 
     def process_result(self, result):
-        row, col, hit = result.split(",")
+        row, col, hit = result
         row, col = int(row), int(col)
         print(f"Processing result: ({row}, {col}), hit: {hit}")
+        self.fired.add((row, col))
 
         if hit == "HIT":
-            self.guess_buttons[row][col].config(bg='red')
+            self.guess_board.set_color(row, col, 'red')
         else:
-            self.guess_buttons[row][col].config(bg='black')
+            self.guess_board.set_color(row, col, 'black')
+
+    def apply_resync(self, state):
+        # Whole shot state as bitboards: hits and misses on our ships, then our own hits and misses
+        _, size, own_hits, own_misses, hits, misses = state.split("|")
+        size = int(size)
+        for mask, board, color in ((own_hits, self.ship_board, 'red'), (own_misses, self.ship_board, 'black'),
+                                   (hits, self.guess_board, 'red'), (misses, self.guess_board, 'black')):
+            for r, c in mask_cells(int(mask, 16), size):
+                board.set_color(r, c, color)
+                if board is self.guess_board:
+                    self.fired.add((r, c))
+        for r, c in mask_cells(int(own_hits, 16), size):
+            if (r, c) not in self.board.shots:
+                self.board.shoot(r, c)
 
     def mark_hit_on_ship(self, hit_info):
-        row, col = map(int, hit_info.split(","))
-        self.buttons[row][col].config(bg='red')
+        row, col = map(int, hit_info)
+        self.board.shoot(row, col)
+        self.ship_board.set_color(row, col, 'red')
 
     def mark_miss_on_ship(self, miss_info):
-        row, col = map(int, miss_info.split(","))
-        self.buttons[row][col].config(bg='black')
+        row, col = map(int, miss_info)
+        self.ship_board.set_color(row, col, 'black')
 
     def process_win(self, win_info):
         if win_info == "YES":
@@ -167,4 +352,18 @@ class BattleshipClient:
         self.window.quit()
 
 if __name__ == "__main__":
-    client = BattleshipClient()
+    parser = argparse.ArgumentParser(description="Schiffe versenken client")
+    parser.add_argument("--host", default='192.168.5.143')
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--binary", action="store_true", help="use the compact binary encoding")
+    parser.add_argument("--canvas", action="store_true", help="draw the boards on a canvas instead of buttons")
+    parser.add_argument("--debug-timing", action="store_true", help="print socket receive to redraw latency")
+    parser.add_argument("--profile", default=None, help="analytics JSON written by SchiffeVersenkenAnalytics.py --out")
+    args = parser.parse_args()
+
+    profiles = None
+    if args.profile:
+        # Imported here: the analytics need NumPy, playing without a profile does not
+        from SchiffeVersenkenAnalytics import Profile
+        profiles = Profile.load(args.profile)
+    client = BattleshipClient(args.host, args.port, args.binary, args.canvas, args.debug_timing, profiles)
@@ -0,0 +1,356 @@
+import random
+from functools import lru_cache
+
+HIT = "HIT"
+MISS = "MISS"
+
+# (size, name) of every ship, as placed in SchiffeVersenkenSpielTK and in the network client
+DEFAULT_FLEET = [(4, "Flugzeugträger"), (3, "Schlachtschiff"), (2, "U-Boot"), (1, "Fischerboot")]
+CLIENT_FLEET = [(4, "Flugzeugträger"), (3, "Kreuzer"), (2, "Schiff"), (1, "Fischerboot")]
+
+# Whole-fleet draws FleetSampler.sample() makes before it checks whether the fleet fits at all. One draw in
+# about 4000 fits for the no-touching fleet 4,3,3,2,2,2,1,1,1,1 on 10x10, so that one rarely gets there
+SAMPLE_TRIES = 100000
+
+
+def parse_positions(text):
+    # "r:c,r:c;r:c" -> [[(r, c), (r, c)], [(r, c)]], ships are separated by ";"
+    ships = []
+    for ship in text.split(";"):
+        cells = [tuple(map(int, pos.split(":"))) for pos in ship.split(",") if pos]
+        if cells:
+            ships.append(cells)
+    return ships
+
+
+def format_positions(ships):
+    return ";".join(",".join(f"{r}:{c}" for r, c in cells) for cells in ships)
+
+
+def line_cells(row, col, length, vertical):
+    if vertical:
+        return [(row + i, col) for i in range(length)]
+    return [(row, col + i) for i in range(length)]
+
+
+def mask_cells(mask, size):
+    # Cells of a bitboard, the inverse of Board.mask
+    cells = []
+    while mask:
+        low = mask & -mask
+        index = low.bit_length() - 1
+        cells.append((index // size, index % size))
+        mask ^= low
+    return cells
+
+
+def is_straight(cells):
+    rows = sorted(r for r, _ in cells)
+    cols = sorted(c for _, c in cells)
+    if len(set(rows)) == 1:
+        return cols == list(range(cols[0], cols[0] + len(cols)))
+    if len(set(cols)) == 1:
+        return rows == list(range(rows[0], rows[0] + len(rows)))
+    return False
+
+
+def _continues(run, cell):
+    # Whether cell extends the straight run of cells by one step
+    last = run[-1]
+    step = (cell[0] - last[0], cell[1] - last[1])
+    if len(run) == 1:
+        return step in ((1, 0), (0, 1))
+    return step == (last[0] - run[-2][0], last[1] - run[-2][1])
+
+
+def random_fleet(fleet=DEFAULT_FLEET, size=10, rng=random, adjacent=True):
+    # Board with every ship at a random legal spot, see FleetSampler
+    ships = fleet_sampler(tuple(fleet), size, adjacent).sample(rng)
+    if ships is None:
+        raise ValueError("fleet does not fit on the board")
+    board = Board(size, adjacent)
+    for (_, name), cells in zip(fleet, ships):
+        board.add_ship(cells, name)
+    return board
+
+
+@lru_cache(maxsize=None)
+def _column_mask(size, col, length=None):
+    # Bits of one column (or its first `length` cells) on a size x size bitboard
+    return sum(1 << (row * size + col) for row in range(size if length is None else length))
+
+
+class GameConfig:
+    # Board dimensions, fleet composition and whether ships may touch, sent to clients as CONFIG
+    def __init__(self, size=10, fleet=CLIENT_FLEET, adjacent=True):
+        self.size = size
+        self.fleet = list(fleet)
+        self.adjacent = adjacent
+
+    def to_text(self):
+        fleet = ",".join(f"{ship_size}:{name}" for ship_size, name in self.fleet)
+        return f"size={self.size};fleet={fleet};adjacent={'yes' if self.adjacent else 'no'}"
+
+    @classmethod
+    def from_text(cls, text):
+        values = dict(part.split("=", 1) for part in text.split(";") if "=" in part)
+        return cls(int(values.get("size", 10)), cls.parse_fleet(values["fleet"]) if "fleet" in values else CLIENT_FLEET,
+                   values.get("adjacent", "yes") == "yes")
+
+    @staticmethod
+    def parse_fleet(text):
+        # "4:Flugzeugträger,3:Kreuzer" or just sizes like "4,3,2,1"
+        fleet = []
+        for i, item in enumerate(text.split(",")):
+            ship_size, _, name = item.partition(":")
+            fleet.append((int(ship_size), name or f"Schiff {i + 1}"))
+        return fleet
+
+    def new_board(self):
+        return Board(self.size, self.adjacent)
+
+    def parse_ships(self, text):
+        # SHIP_POSITIONS payload as ships. A baseline client sends all cells in one comma list, ship after ship,
+        # so a payload without ";" is cut into straight runs first
+        ships = parse_positions(text)
+        if ";" in text or len(ships) != 1:
+            return ships
+        return self.split_runs(ships[0])
+
+    def split_runs(self, cells):
+        runs = []
+        for cell in cells:
+            if runs and _continues(runs[-1], cell):
+                runs[-1].append(cell)
+            else:
+                runs.append([cell])
+        if sorted(map(len, runs)) == sorted(ship_size for ship_size, _ in self.fleet):
+            return runs
+        # Ships placed end to end form one longer run, cut it at the configured lengths in fleet order
+        ships, pos = [], 0
+        for ship_size, _ in self.fleet:
+            ships.append(cells[pos:pos + ship_size])
+            pos += ship_size
+        return ships if pos == len(cells) else runs
+
+    def validate(self, ships):
+        # Returns the reason why a fleet is not allowed, or None if it is
+        if sorted(len(cells) for cells in ships) != sorted(ship_size for ship_size, _ in self.fleet):
+            return "fleet does not match the configured ships"
+        board = self.new_board()
+        for cells in ships:
+            if not is_straight(cells):
+                return "ship is not a straight line"
+            if not board.can_place(cells):
+                return "ship overlaps, touches another ship or leaves the board"
+            board.add_ship(cells)
+        return None
+
+
+class Board:
+    def __init__(self, size=10, adjacent=True):
+        self.size = size
+        self.adjacent = adjacent  # False: ships may not touch, not even diagonally
+        self.occupied = 0  # Bitboard of ship cells, bit row * size + col
+        self.blocked = 0  # Bitboard of cells no further ship may use
+        self.cells = {}  # (row, col) -> index of the ship occupying the cell
+        self.ships = []  # ship names, indexed like self.remaining
+        self.positions = []  # cells of each ship in placement order
+        self.remaining = []  # cells of each ship that have not been hit yet
+        self.shots = set()
+        self.cells_left = 0
+
+    def add_ship(self, cells, name=None):
+        index = len(self.ships)
+        cells = [tuple(pos) for pos in cells]
+        for pos in cells:
+            self.cells[pos] = index
+        mask = self.mask(cells)
+        self.occupied |= mask
+        self.blocked |= mask if self.adjacent else self.halo(mask)
+        self.ships.append(index if name is None else name)
+        self.positions.append(cells)
+        self.remaining.append(len(cells))
+        self.cells_left += len(cells)
+        return index
+
+    def mask(self, cells):
+        mask = 0
+        for r, c in cells:
+            mask |= 1 << (r * self.size + c)
+        return mask
+
+    def line_mask(self, row, col, length, vertical):
+        # Bitboard of a straight ship, None if it leaves the board
+        size = self.size
+        if row < 0 or col < 0 or row >= size or col >= size:
+            return None
+        if vertical:
+            if row + length > size:
+                return None
+            return _column_mask(size, 0, length) << (row * size + col)
+        if col + length > size:
+            return None
+        return ((1 << length) - 1) << (row * size + col)
+
+    def halo(self, mask):
+        # The mask grown by one cell in all eight directions, clipped to the board
+        size = self.size
+        full = (1 << size * size) - 1
+        grown = mask | ((mask << 1) & ~_column_mask(size, 0)) | ((mask >> 1) & ~_column_mask(size, size - 1))
+        return (grown | (grown << size) | (grown >> size)) & full
+
+    def fits(self, mask):
+        # A whole ship is checked against all placed ships with one AND
+        return mask is not None and not mask & self.blocked
+
+    def can_place(self, cells):
+        return all(0 <= r < self.size and 0 <= c < self.size for r, c in cells) and self.fits(self.mask(cells))
+
+    def can_place_line(self, row, col, length, vertical):
+        return self.fits(self.line_mask(row, col, length, vertical))
+
+    def shoot(self, row, col):
+        # Returns (hit, name of the sunk ship or None); repeated shots never count twice
+        pos = (row, col)
+        index = self.cells.get(pos)
+        if pos in self.shots:
+            return index is not None, None
+        self.shots.add(pos)
+        if index is None:
+            return False, None
+        self.remaining[index] -= 1
+        self.cells_left -= 1
+        if self.remaining[index] == 0:
+            return True, self.ships[index]
+        return True, None
+
+    def all_sunk(self):
+        return self.cells_left == 0
+
+
+class FleetSampler:
+    # Random legal fleets drawn from every placement of every ship, precomputed once as bitboards
+    def __init__(self, fleet=DEFAULT_FLEET, size=10, adjacent=True):
+        self.fleet = list(fleet)
+        self.size = size
+        self.adjacent = adjacent
+        board = Board(size, adjacent)
+        self.placements = {}  # ship length -> [(ship mask, mask it blocks, cells)]
+        for length in {ship_size for ship_size, _ in self.fleet}:
+            options = []
+            for vertical in (False, True) if length > 1 else (False,):
+                for row in range(size):
+                    for col in range(size):
+                        mask = board.line_mask(row, col, length, vertical)
+                        if mask is not None:
+                            blocks = mask if adjacent else board.halo(mask)
+                            options.append((mask, blocks, line_cells(row, col, length, vertical)))
+            self.placements[length] = options
+        # Largest ships first, they have the fewest places left on a crowded board
+        self.order = sorted(range(len(self.fleet)), key=lambda i: -self.fleet[i][0])
+
+    def sample(self, rng=random, blocked=0, tries=SAMPLE_TRIES):
+        # Cells of every ship in fleet order, avoiding the cells in `blocked`; None if nothing fits.
+        # The whole fleet is redrawn on any collision, so every legal fleet is equally likely. After `tries`
+        # collisions in a row, drawing goes on only once a ship-by-ship draw proved that some fleet fits
+        while True:
+            for _ in range(tries):
+                ships = self._exact(rng, blocked)
+                if ships is not None:
+                    return ships
+            if all(self._sequential(rng, blocked) is None for _ in range(100)):
+                return None
+
+    def _sequential(self, rng, blocked):
+        # Ship after ship, each uniform over the placements its predecessors leave free. Much faster on crowded
+        # boards but not uniform over whole fleets: fleets with fewer alternatives come up too often
+        ships = [None] * len(self.fleet)
+        for index in self.order:
+            options = self.placements[self.fleet[index][0]]
+            for _ in range(8):  # Direct draws nearly always hit a free placement on a sparse board
+                option = options[int(rng.random() * len(options))]
+                if not option[0] & blocked:
+                    break
+            else:
+                free = [option for option in options if not option[0] & blocked]
+                if not free:
+                    return None
+                option = free[int(rng.random() * len(free))]
+            blocked |= option[1]
+            ships[index] = option[2]
+        return ships
+
+    def _exact(self, rng, blocked):
+        ships = []
+        for ship_size, _ in self.fleet:
+            options = self.placements[ship_size]
+            option = options[int(rng.random() * len(options))]
+            if option[0] & blocked:
+                return None
+            blocked |= option[1]
+            ships.append(option[2])
+        return ships
+
+    def bulk(self, count, rng=random, exact=True):
+        # Stream of fleets for simulations and load tests; exact=False draws them ship by ship, see _sequential
+        sample = self._exact if exact else self._sequential
+        produced = 0
+        while produced < count:
+            ships = sample(rng, 0)
+            if ships is not None:
+                produced += 1
+                yield ships
+
+
+@lru_cache(maxsize=64)
+def fleet_sampler(fleet, size=10, adjacent=True):
+    # Shared sampler per configuration, building the placement tables costs more than a thousand fleets
+    return FleetSampler(fleet, size, adjacent)
+
+
+class Game:
+    # Rules of one match without any UI: placement, turn order, shots, sunk ships and the winner
+
+    def __init__(self, size=10, adjacent=True):
+        self.size = size
+        self.adjacent = adjacent
+        self.boards = [Board(size, adjacent), Board(size, adjacent)]  # Fleet of player 0 and player 1
+        self.current_player = 0
+        self.winner = None
+
+    def place_ship(self, player, cells, name=None):
+        board = self.boards[player]
+        if not board.can_place(cells):
+            return False
+        board.add_ship(cells, name)
+        return True
+
+    def place_fleet(self, player, ships):
+        # ships: [[(row, col), ...], ...] or {name: [(row, col), ...]}, replaces earlier placements
+        board = self.boards[player] = Board(self.size, self.adjacent)
+        items = ships.items() if isinstance(ships, dict) else ((None, cells) for cells in ships)
+        for name, cells in items:
+            board.add_ship(cells, name)
+        return board
+
+    def is_ready(self):
+        return all(board.ships for board in self.boards)
+
+    def shoot(self, player, row, col):
+        # Returns (hit, sunk ship name or None, won) or None if the shot is not allowed
+        if self.winner is not None or player != self.current_player:
+            return None
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            return None
+        board = self.boards[1 - player]
+        if (row, col) in board.shots:
+            return None  # Already fired at, a repeated miss must not hand the turn over again
+        hit, sunk = board.shoot(row, col)
+        if not hit:
+            self.current_player = 1 - player
+            return False, None, False
+        if board.all_sunk():
+            self.winner = player
+            return True, sunk, True
+        return True, sunk, False
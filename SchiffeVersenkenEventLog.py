@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import mmap
+import os
+import struct
+import zlib
+
+from SchiffeVersenkenEngine import Game, GameConfig
+
+# Record: body length and CRC-32 of the body, then the body: type, match id, payload
+_HEADER = struct.Struct("!II")
+_KIND = struct.Struct("!BI")
+_CELL = struct.Struct("!HH")
+_SHOT = struct.Struct("!BHH")
+_COUNT = struct.Struct("!H")
+_STATE = struct.Struct("!BBB")
+
+# CHECKPOINT opens every segment, its match id is the highest one handed out so far
+MATCH, FLEET, SHOT, END, SNAPSHOT, SESSION, CHECKPOINT = 1, 2, 3, 4, 5, 6, 7
+RECORD_NAMES = {MATCH: "MATCH", FLEET: "FLEET", SHOT: "SHOT", END: "END", SNAPSHOT: "SNAPSHOT", SESSION: "SESSION",
+                CHECKPOINT: "CHECKPOINT"}
+NOBODY = 255  # Winner of a match that was abandoned, current player of a match not started
+
+
+def _pack_text(text):
+    data = text.encode()
+    return _COUNT.pack(len(data)) + data
+
+
+def _unpack_text(buffer, pos):
+    (length,), pos = _COUNT.unpack_from(buffer, pos), pos + _COUNT.size
+    return bytes(buffer[pos:pos + length]).decode(), pos + length
+
+
+def _pack_cells(cells):
+    return _COUNT.pack(len(cells)) + b"".join(_CELL.pack(row, col) for row, col in cells)
+
+
+def _unpack_cells(buffer, pos):
+    (count,), pos = _COUNT.unpack_from(buffer, pos), pos + _COUNT.size
+    cells = [_CELL.unpack_from(buffer, pos + i * _CELL.size) for i in range(count)]
+    return cells, pos + count * _CELL.size
+
+
+def _pack_fleet(ships):
+    return _COUNT.pack(len(ships)) + b"".join(_pack_cells(cells) for cells in ships)
+
+
+def _unpack_fleet(buffer, pos):
+    (count,), pos = _COUNT.unpack_from(buffer, pos), pos + _COUNT.size
+    ships = []
+    for _ in range(count):
+        cells, pos = _unpack_cells(buffer, pos)
+        ships.append(cells)
+    return ships, pos
+
+
+def unpack_fleet_event(payload):
+    # (player, ships) of a FLEET record
+    ships, _ = _unpack_fleet(payload, 1)
+    return payload[0], ships
+
+
+def unpack_shot_event(payload):
+    # (player, row, col) of a SHOT record
+    return _SHOT.unpack_from(payload)
+
+
+def encode_record(kind, match_id, payload=b""):
+    body = _KIND.pack(kind, match_id) + payload
+    return _HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(buffer, start=0):
+    # Yields (kind, match id, payload memoryview, offset after the record); stops at the first torn record
+    view = memoryview(buffer)
+    pos, end = start, len(buffer)
+    while pos + _HEADER.size <= end:
+        length, crc = _HEADER.unpack_from(view, pos)
+        body_start = pos + _HEADER.size
+        body_end = body_start + length
+        if length < _KIND.size or body_end > end or zlib.crc32(view[body_start:body_end]) != crc:
+            return
+        kind, match_id = _KIND.unpack_from(view, body_start)
+        pos = body_end
+        yield kind, match_id, view[body_start + _KIND.size:body_end], pos
+
+
+def _checked_end(view, pos, end):
+    # Offset after the record at pos if its header and CRC check out, else None
+    if pos + _HEADER.size > end:
+        return None
+    length, crc = _HEADER.unpack_from(view, pos)
+    body_start = pos + _HEADER.size
+    body_end = body_start + length
+    if length < _KIND.size or body_end > end or zlib.crc32(view[body_start:body_end]) != crc:
+        return None
+    return body_end
+
+
+def find_record(buffer, start):
+    # Offset of the first record at or after start, for readers that begin somewhere inside a log. An offset
+    # where two records in a row check out (or one that ends the log) is taken as a record boundary
+    view = memoryview(buffer)
+    end = len(buffer)
+    for pos in range(start, end):
+        following = _checked_end(view, pos, end)
+        if following is not None and (following == end or _checked_end(view, following, end) is not None):
+            return pos
+    return end
+
+
+def open_log(path):
+    # Read-only mapping of the whole log, or b"" while the file is empty
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MatchState:
+    # Everything needed to carry on a match, rebuilt from its last snapshot plus the events after it
+    def __init__(self, match_id, config):
+        self.match_id = match_id
+        self.config = config
+        self.game = Game(config.size, config.adjacent)
+        self.fleets = [None, None]
+        self.tokens = [None, None]  # Session tokens, so players can resume a recovered match
+        self.started = False
+        self.finished = False
+
+    def apply(self, kind, payload):
+        if kind == FLEET:
+            player, ships = unpack_fleet_event(payload)
+            self.fleets[player] = ships or None  # An empty fleet: the player left before the game started
+            self.game.place_fleet(player, ships)
+            self.started = all(fleet is not None for fleet in self.fleets)
+        elif kind == SHOT:
+            player, row, col = unpack_shot_event(payload)
+            self.game.shoot(player, row, col)
+        elif kind == SESSION:
+            self.tokens[payload[0]] = bytes(payload[1:]).decode() or None
+        elif kind == END:
+            self.finished = True
+            if payload[0] != NOBODY:
+                self.game.winner = payload[0]
+
+    def snapshot(self):
+        game = self.game
+        payload = bytearray(_pack_text(self.config.to_text()))
+        payload += _STATE.pack(self.finished, game.current_player, NOBODY if game.winner is None else game.winner)
+        for player in (0, 1):
+            fleet = self.fleets[player]
+            payload += b"\x01" + _pack_fleet(fleet) if fleet is not None else b"\x00"
+            payload += _pack_cells(sorted(game.boards[player].shots))
+            payload += _pack_text(self.tokens[player] or "")
+        return bytes(payload)
+
+    @classmethod
+    def from_snapshot(cls, match_id, payload):
+        text, pos = _unpack_text(payload, 0)
+        state = cls(match_id, GameConfig.from_text(text))
+        finished, current_player, winner = _STATE.unpack_from(payload, pos)
+        pos += _STATE.size
+        for player in (0, 1):
+            has_fleet, pos = payload[pos], pos + 1
+            if has_fleet:
+                state.fleets[player], pos = _unpack_fleet(payload, pos)
+                state.game.place_fleet(player, state.fleets[player])
+            shots, pos = _unpack_cells(payload, pos)
+            board = state.game.boards[player]
+            for row, col in shots:
+                board.shoot(row, col)
+            token, pos = _unpack_text(payload, pos)
+            state.tokens[player] = token or None
+        state.started = all(fleet is not None for fleet in state.fleets)
+        state.finished = bool(finished)
+        state.game.current_player = current_player
+        state.game.winner = None if winner == NOBODY else winner
+        return state
+
+
+def recover(path):
+    # Matches still in play when the log ends, {match id: MatchState}, and the highest match id seen.
+    # Only the events after each match's last snapshot go through the engine again
+    try:
+        buffer = open_log(path)
+    except FileNotFoundError:
+        return {}, 0, 0
+    latest = {}  # match id -> (kind, payload) of the MATCH or SNAPSHOT record to start from
+    tails = {}  # match id -> events after it
+    last_id = 0
+    valid_end = 0
+    for kind, match_id, payload, valid_end in read_records(buffer):
+        last_id = max(last_id, match_id)
+        if kind == CHECKPOINT:
+            continue
+        if kind in (MATCH, SNAPSHOT):
+            latest[match_id] = (kind, payload)
+            tails[match_id] = []
+        elif kind == END:
+            latest.pop(match_id, None)
+            tails.pop(match_id, None)
+        elif match_id in tails:
+            tails[match_id].append((kind, payload))
+    matches = {}
+    for match_id, (kind, payload) in latest.items():
+        if kind == MATCH:
+            state = MatchState(match_id, GameConfig.from_text(bytes(payload).decode()))
+        else:
+            state = MatchState.from_snapshot(match_id, payload)
+        for event in tails[match_id]:
+            state.apply(*event)
+        matches[match_id] = state
+    return matches, last_id, valid_end
+
+
+def next_segment(path):
+    # Free name for a closed segment: events.log.1, events.log.2, ...
+    number = 1
+    while os.path.exists(f"{path}.{number}"):
+        number += 1
+    return f"{path}.{number}"
+
+
+class EventLog:
+    # Append-only binary log of every match. Records collect in memory and are written and fsynced
+    # together every commit_interval seconds, so a guess never waits for the disk; a crash loses at most
+    # the last interval. Every snapshot_every events a match writes its whole state, which bounds recovery.
+    # The log is kept in segments: on every start and whenever the current one outgrows segment_bytes it is
+    # closed as path.1, path.2, ... and the new one opens with snapshots of the matches in play, so recovery
+    # reads only the current segment. The closed ones stay behind as archives for the analytics
+    def __init__(self, path, commit_interval=0.05, snapshot_every=64, sync=True, segment_bytes=1 << 26):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.sync = sync
+        self.segment_bytes = segment_bytes
+        self.pending = bytearray()
+        self.states = {}  # match id -> MatchState mirrored from the events, for snapshots
+        self.since_snapshot = {}
+        self.records = 0
+        self.commits = 0
+        self.commit_task = None
+        self.file = None
+        self.archived = None  # Path the segment found on start was closed as
+        if not os.path.exists(path) and os.path.exists(path + ".new"):
+            os.rename(path + ".new", path)  # A rotation was cut short right after closing the old segment
+        self.recovered, self.last_match_id, valid_end = recover(path)
+        self.states.update(self.recovered)
+        self.since_snapshot.update((match_id, 0) for match_id in self.recovered)
+        if os.path.exists(path) and os.path.getsize(path) > valid_end:
+            # Cut off a record torn by the crash so the closed segment stays readable
+            os.truncate(path, valid_end)
+        if valid_end and not self.unchanged(valid_end):
+            self.archived = self.rotate()
+        else:
+            self.file = open(path, "ab")
+
+    def head(self):
+        # First records of a segment: the checkpoint, then a snapshot of every match in play
+        head = bytearray(encode_record(CHECKPOINT, self.last_match_id))
+        for match_id, state in self.states.items():
+            head += encode_record(SNAPSHOT, match_id, state.snapshot())
+        return bytes(head)
+
+    def unchanged(self, size):
+        # The segment holds nothing but its head, nothing happened since the last start
+        head = self.head()
+        if size != len(head):
+            return False
+        with open(self.path, "rb") as f:
+            return f.read() == head
+
+    def rotate(self):
+        # Closes the current segment and opens the next one with its head. The new segment is complete on disk
+        # before it takes the log's name, a crash in between is finished on the next start
+        head = self.head()
+        self.since_snapshot = dict.fromkeys(self.states, 0)
+        with open(self.path + ".new", "wb") as f:
+            f.write(head)
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+        if self.file:
+            self.write()
+            if self.sync:
+                os.fsync(self.file.fileno())
+            self.file.close()
+        archived = next_segment(self.path)
+        os.rename(self.path, archived)
+        os.rename(self.path + ".new", self.path)
+        self.file = open(self.path, "ab")
+        return archived
+
+    def append(self, kind, match_id, payload=b""):
+        self.pending += encode_record(kind, match_id, payload)
+        self.records += 1
+        if len(self.pending) > 1 << 20:
+            self.write()
+
+    def match_started(self, match_id, config):
+        self.last_match_id = max(self.last_match_id, match_id)
+        self.states[match_id] = MatchState(match_id, config)
+        self.since_snapshot[match_id] = 0
+        self.append(MATCH, match_id, config.to_text().encode())
+
+    def fleet(self, match_id, player, ships):
+        self.event(match_id, FLEET, bytes((player,)) + _pack_fleet(ships))
+
+    def shot(self, match_id, player, row, col):
+        self.event(match_id, SHOT, _SHOT.pack(player, row, col))
+
+    def session(self, match_id, player, token):
+        self.event(match_id, SESSION, bytes((player,)) + (token or "").encode())
+
+    def match_ended(self, match_id, winner=None):
+        self.append(END, match_id, bytes((NOBODY if winner is None else winner,)))
+        self.states.pop(match_id, None)
+        self.since_snapshot.pop(match_id, None)
+
+    def event(self, match_id, kind, payload):
+        self.append(kind, match_id, payload)
+        state = self.states.get(match_id)
+        if state is None:
+            return
+        state.apply(kind, payload)
+        self.since_snapshot[match_id] += 1
+        if self.since_snapshot[match_id] >= self.snapshot_every:
+            self.since_snapshot[match_id] = 0
+            self.append(SNAPSHOT, match_id, state.snapshot())
+
+    def write(self):
+        if self.pending:
+            self.file.write(self.pending)
+            self.pending = bytearray()
+        self.file.flush()
+
+    async def commit(self):
+        # Group commit: one write and one fsync for everything logged since the last one
+        if not self.pending:
+            return
+        self.write()
+        self.commits += 1
+        if self.sync:
+            await asyncio.get_running_loop().run_in_executor(None, os.fsync, self.file.fileno())
+        if self.file.tell() >= self.segment_bytes:
+            self.rotate()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            await self.commit()
+
+    def start(self):
+        self.commit_task = asyncio.create_task(self.run())
+
+    def close(self):
+        if self.commit_task:
+            self.commit_task.cancel()
+        self.write()
+        if self.sync:
+            os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def replay(path, match_filter=None, verbose=False):
+    # Streams the log through the engine and checks every recorded winner against the replayed one
+    games = {}
+    finished = mismatches = 0
+    for kind, match_id, payload, _ in read_records(open_log(path)):
+        if match_filter is not None and match_id != match_filter:
+            continue
+        if verbose:
+            print(f"{match_id:>8} {RECORD_NAMES.get(kind, kind)}")
+        if kind == MATCH:
+            games[match_id] = MatchState(match_id, GameConfig.from_text(bytes(payload).decode()))
+        elif kind == SNAPSHOT:
+            if match_id not in games:
+                games[match_id] = MatchState.from_snapshot(match_id, payload)
+        elif kind == END:
+            state = games.pop(match_id, None)
+            if state is None:
+                continue
+            finished += 1
+            recorded = None if payload[0] == NOBODY else payload[0]
+            if state.game.winner != recorded:
+                mismatches += 1
+                print(f"Match {match_id}: log says winner {recorded}, replay says {state.game.winner}")
+        elif match_id in games:
+            games[match_id].apply(kind, payload)
+    return finished, len(games), mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a Schiffe versenken event log through the game engine")
+    parser.add_argument("path")
+    parser.add_argument("--match", type=int, default=None, help="only this match id")
+    parser.add_argument("--verbose", action="store_true", help="print every record")
+    parser.add_argument("--recover", action="store_true", help="show the matches a restarted server would resume")
+    args = parser.parse_args()
+
+    if args.recover:
+        matches, last_id, _ = recover(args.path)
+        for match_id, state in sorted(matches.items()):
+            shots = [len(board.shots) for board in state.game.boards]
+            print(f"Match {match_id}: started={state.started} turn=Player {state.game.current_player + 1} shots={shots}")
+        print(f"{len(matches)} matches in play, last match id {last_id}")
+    else:
+        finished, open_matches, mismatches = replay(args.path, args.match, args.verbose)
+        print(f"{finished} finished matches replayed, {open_matches} still open, {mismatches} mismatches")
@@ -0,0 +1,81 @@
+import argparse
+import random
+import sys
+import time
+
+from SchiffeVersenkenEngine import CLIENT_FLEET, Board, GameConfig, fleet_sampler, format_positions, line_cells
+
+# Configurations for the benchmark, from the classic fleet to ones that nearly fill the board
+BENCHMARKS = [
+    ("classic 10x10", GameConfig(10, CLIENT_FLEET)),
+    ("classic 10x10 no touching", GameConfig(10, CLIENT_FLEET, False)),
+    ("dense 10x10 no touching", GameConfig(10, GameConfig.parse_fleet("4,3,3,2,2,2,1,1,1,1"), False)),
+    ("dense 10x10", GameConfig(10, GameConfig.parse_fleet("5,4,4,3,3,3,2,2,2,2"))),
+    ("large 50x50", GameConfig(50, GameConfig.parse_fleet("5,4,4,3,3,3,2,2,2,2,1,1,1,1,1") * 4)),
+]
+
+
+def rejection_fleet(config, rng=random):
+    # Naive baseline: random spot and direction per ship, cell by cell checks, start over on any collision
+    while True:
+        board = Board(config.size, config.adjacent)
+        for ship_size, name in config.fleet:
+            vertical = rng.random() < 0.5
+            row, col = rng.randrange(config.size), rng.randrange(config.size)
+            cells = line_cells(row, col, ship_size, vertical)
+            if not board.can_place(cells):
+                break
+            board.add_ship(cells, name)
+        else:
+            return board.positions
+
+
+def rate(sample, seconds):
+    # Fleets per second produced by sample() within the time budget
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(10):
+            sample()
+        count += 10
+    return count / (time.perf_counter() - start)
+
+
+def benchmark(seconds=1.0, seed=0):
+    rng = random.Random(seed)
+    print(f"{'configuration':<28}{'rejection':>12}{'masks':>12}{'sequential':>12}  fleets/sec, sequential not uniform")
+    for label, config in BENCHMARKS:
+        sampler = fleet_sampler(tuple(config.fleet), config.size, config.adjacent)
+        naive = rate(lambda: rejection_fleet(config, rng), seconds)
+        fast = rate(lambda: sampler.sample(rng), seconds)
+        sequential = rate(lambda: next(sampler.bulk(1, rng, exact=False)), seconds)
+        print(f"{label:<28}{naive:>12.0f}{fast:>12.0f}{sequential:>12.0f}  x{fast / naive:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random fleets for Schiffe versenken")
+    parser.add_argument("--count", type=int, default=1, help="number of fleets, one SHIP_POSITIONS payload per line")
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--fleet", default=None, help='ships as "4:Flugzeugträger,3:Kreuzer,..." or sizes "5,4,3,3,2"')
+    parser.add_argument("--no-touching", action="store_true")
+    parser.add_argument("--sequential", action="store_true",
+                        help="ship by ship, much faster on crowded boards but NOT uniform over whole fleets")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--benchmark", action="store_true", help="compare with naive rejection sampling")
+    parser.add_argument("--seconds", type=float, default=1.0, help="time per benchmark measurement")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.seconds, args.seed or 0)
+    else:
+        fleet = GameConfig.parse_fleet(args.fleet) if args.fleet else CLIENT_FLEET
+        sampler = fleet_sampler(tuple(fleet), args.size, not args.no_touching)
+        start = time.perf_counter()
+        write = sys.stdout.write
+        for ships in sampler.bulk(args.count, random.Random(args.seed), not args.sequential):
+            write(format_positions(ships) + "\n")
+        elapsed = time.perf_counter() - start
+        placement = "ship by ship, NOT uniform over whole fleets" if args.sequential else "uniform over whole fleets"
+        print(f"{args.count} fleets in {elapsed:.2f} s ({args.count / elapsed * 60:.0f} per minute), {placement}",
+              file=sys.stderr)
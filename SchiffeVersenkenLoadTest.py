@@ -0,0 +1,262 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from SchiffeVersenkenEngine import GameConfig, format_positions, random_fleet
+from SchiffeVersenkenProtocol import BINARY, TEXT, MessageStream
+from SchiffeVersenkenStrategies import HuntTargetStrategy
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SchiffeVersenkenServer .py")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def read_stat(pid):
+    # Fields of /proc/<pid>/stat after the command name, None once the process is gone
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+
+
+class ProcessSampler:
+    # Peak RSS and CPU time of the server process and its children (the workers behind a supervisor), from /proc
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss = 0
+        self.start_cpu = self.cpu_seconds()
+
+    def processes(self):
+        # {pid: stat fields} of the server and every process whose parent it is
+        stats = {self.pid: read_stat(self.pid)}
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                fields = read_stat(entry)
+                if fields and int(fields[1]) == self.pid:
+                    stats[int(entry)] = fields
+        return {pid: fields for pid, fields in stats.items() if fields}
+
+    def cpu_seconds(self):
+        # User and system time, plus that of children already waited for, such as restarted workers
+        ticks = sum(sum(int(value) for value in fields[11:15]) for fields in self.processes().values())
+        return ticks / os.sysconf("SC_CLK_TCK")
+
+    def sample(self):
+        rss = 0
+        for pid in self.processes():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+            except (FileNotFoundError, ProcessLookupError):
+                pass  # Exited since the listing
+        self.peak_rss = max(self.peak_rss, rss)
+
+    async def run(self, interval=0.2):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+class Stats:
+    def __init__(self):
+        self.connect_times = []
+        self.round_trips = []
+        self.matches = 0
+        self.errors = 0
+        self.spectator_events = 0
+        self.snapshots = 0
+
+
+class LoadClient:
+    # Headless player speaking the same SHIP_POSITIONS/GUESS messages as BattleshipClient
+    def __init__(self, host, port, stats, seed, binary=False):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.rng = random.Random(seed)
+        self.binary = binary
+
+    async def play(self):
+        start = time.perf_counter()
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.stats.connect_times.append(time.perf_counter() - start)
+        stream = MessageStream()
+        if self.binary:
+            writer.write(TEXT.encode("ENCODING", (BINARY.name,)))
+            stream.send_codec = BINARY
+        sent_at = None
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                for kind, fields in stream.feed(data):
+                    if kind == "ENCODING":
+                        stream.codec = BINARY if fields[0] == BINARY.name else TEXT
+                    elif kind == "CONFIG":
+                        # The fleet is placed once the server has said which board and ships it plays with
+                        config = GameConfig.from_text(fields[0])
+                        board = random_fleet(config.fleet, config.size, self.rng, config.adjacent)
+                        self.strategy = HuntTargetStrategy(config.size, self.rng, config.fleet)
+                        writer.write(stream.encode("SHIP_POSITIONS", format_positions(board.positions)))
+                    elif kind == "TURN" and fields[0] == "YES":
+                        row, col = self.strategy.next_shot()
+                        sent_at = time.perf_counter()
+                        writer.write(stream.encode("GUESS", row, col))
+                    elif kind == "PING":
+                        writer.write(stream.encode("PONG"))
+                    elif kind == "RESULT":
+                        self.stats.round_trips.append(time.perf_counter() - sent_at)
+                        self.strategy.observe(int(fields[0]), int(fields[1]), fields[2] == "HIT", None)
+                    elif kind == "WIN":
+                        if fields[0] == "YES":
+                            self.stats.matches += 1
+                        return
+        finally:
+            writer.close()
+
+
+class SpectatorClient:
+    # Follows one match on the spectator port; a stalled one stops reading for a while to provoke the lag policy
+    def __init__(self, host, port, stats, match_id, stall=0.0):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.match_id = match_id
+        self.stall = stall
+
+    async def play(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write(TEXT.encode("SPECTATE", (self.match_id,)))
+        stream = MessageStream()
+        try:
+            if self.stall:
+                await asyncio.sleep(self.stall)
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                for kind, _ in stream.feed(data):
+                    if kind == "ERROR":
+                        return  # The match was already over
+                    if kind == "SNAPSHOT":
+                        self.stats.snapshots += 1
+                    elif kind in ("SHOT", "TURN_OF", "WINNER"):
+                        self.stats.spectator_events += 1
+        finally:
+            writer.close()
+
+
+async def run(host, port, clients, seed=0, binary=False, server_pid=None, ramp=0.0,
+              spectators=0, spectator_port=None, stall=0.0):
+    stats = Stats()
+    sampler = ProcessSampler(server_pid) if server_pid else None
+    sampling = asyncio.create_task(sampler.run()) if sampler else None
+
+    async def start_client(index):
+        await asyncio.sleep(ramp * index / clients)
+        try:
+            await LoadClient(host, port, stats, seed + index, binary).play()
+        except OSError:
+            stats.errors += 1
+
+    async def start_spectator(index):
+        match_id = index % max(1, clients // 2) + 1
+        await asyncio.sleep(ramp * 2 * match_id / clients + 0.05)  # Shortly after the first player opened the match
+        try:
+            await SpectatorClient(host, spectator_port, stats, match_id, stall).play()
+        except OSError:
+            stats.errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(start_client(i) for i in range(clients)),
+                         *(start_spectator(i) for i in range(spectators)))
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "clients": clients,
+        "binary": binary,
+        "elapsed": elapsed,
+        "errors": stats.errors,
+        "matches": stats.matches,
+        "matches_per_sec": stats.matches / elapsed,
+        "connect_p50_ms": percentile(stats.connect_times, 0.50) * 1000,
+        "connect_p99_ms": percentile(stats.connect_times, 0.99) * 1000,
+        "guesses": len(stats.round_trips),
+        "rtt_p50_ms": percentile(stats.round_trips, 0.50) * 1000,
+        "rtt_p95_ms": percentile(stats.round_trips, 0.95) * 1000,
+        "rtt_p99_ms": percentile(stats.round_trips, 0.99) * 1000,
+    }
+    if spectators:
+        report["spectators"] = spectators
+        report["spectator_events"] = stats.spectator_events
+        report["spectator_snapshots"] = stats.snapshots
+    if sampler:
+        sampling.cancel()
+        sampler.sample()
+        report["server_processes"] = len(sampler.processes())
+        report["server_peak_rss_mb"] = sampler.peak_rss / 2 ** 20
+        report["server_cpu_percent"] = (sampler.cpu_seconds() - sampler.start_cpu) / elapsed * 100
+    return report
+
+
+def raise_file_limit():
+    # Thousands of sockets need more descriptors than the usual soft limit of 1024
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the Schiffe versenken server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--clients", type=int, default=1000, help="number of players, two per match")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which the clients connect")
+    parser.add_argument("--spectators", type=int, default=0, help="spectators spread over the matches")
+    parser.add_argument("--spectator-port", type=int, default=5556)
+    parser.add_argument("--stall", type=float, default=0.0, help="seconds the spectators wait before reading")
+    parser.add_argument("--spawn", action="store_true", help="start a local server for the run")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes of the spawned server")
+    parser.add_argument("--server-pid", type=int, default=None, help="sample RSS/CPU of a running server")
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON line")
+    args = parser.parse_args()
+
+    raise_file_limit()
+    server = None
+    server_pid = args.server_pid
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--host", args.host, "--port", str(args.port),
+                                   "--spectator-port", str(args.spectator_port), "--workers", str(args.workers),
+                                   "--log-level", "WARNING"])
+        server_pid = server.pid
+        time.sleep(0.5)
+    try:
+        report = asyncio.run(run(args.host, args.port, args.clients, args.seed, args.binary, server_pid, args.ramp,
+                                 args.spectators, args.spectator_port, args.stall))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>20}: {value:.2f}" if isinstance(value, float) else f"{key:>20}: {value}")
@@ -0,0 +1,206 @@
+import asyncio
+import bisect
+import logging
+import time
+
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+
+def _escape(value):
+    # Label values as the exposition format wants them: backslash, quote and newline escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}  # label value (None without label) -> count
+
+    def inc(self, amount=1, label=None):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def merge(self, label, value):
+        self.values[label] = self.values.get(label, 0) + value
+
+    def samples(self):
+        for label, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            yield self.name, self.labels(label), value
+
+    def labels(self, label, **extra):
+        pairs = [(self.label, label)] if self.label else []
+        pairs += extra.items()
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, label=None):
+        self.values[label] = value
+
+    def dec(self, amount=1, label=None):
+        self.inc(-amount, label)
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, label)
+        self.buckets = buckets
+
+    def observe(self, value, label=None):
+        series = self.values.get(label)
+        if series is None:
+            # Per bucket counts (last one is +Inf), sum, count
+            series = self.values[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def total(self):
+        return sum(series[2] for series in self.values.values())
+
+    def merge(self, label, value):
+        counts, total, count = value
+        series = self.values.get(label)
+        if series is None:
+            self.values[label] = [list(counts), total, count]
+        else:
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+    def quantile(self, fraction, label=None):
+        # Upper bound of the bucket holding the given fraction of observations
+        series = self.values.get(label)
+        if not series or not series[2]:
+            return 0.0
+        rank = fraction * series[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[0]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        for label, (counts, total, count) in sorted(self.values.items(), key=lambda item: str(item[0])):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", self.labels(label, le=le), cumulative
+            yield f"{self.name}_sum", self.labels(label), total
+            yield f"{self.name}_count", self.labels(label), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self.register(Counter(name, help, label))
+
+    def gauge(self, name, help, label=None):
+        return self.register(Gauge(name, help, label))
+
+    def histogram(self, name, help, label=None, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, label, buckets))
+
+    def dump(self):
+        # Every metric's values as JSON-friendly lists, for a supervisor process to merge()
+        return {metric.name: list(metric.values.items()) for metric in self.metrics}
+
+    def merge(self, dumps):
+        # Every metric found in the dumps becomes their sum; histograms add up bucket by bucket
+        by_name = {metric.name: metric for metric in self.metrics}
+        dumps = list(dumps)
+        for dump in dumps:
+            for name in dump:
+                if name in by_name:
+                    by_name[name].values = {}
+        for dump in dumps:
+            for name, values in dump.items():
+                metric = by_name.get(name)
+                if metric is not None:
+                    for label, value in values:
+                        metric.merge(label, value)
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(registry, host="127.0.0.1", port=9100):
+    # Minimal HTTP endpoint: every GET is answered with the current metrics
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = registry.render().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def log_stats(logger, interval, line):
+    # Periodic one-line summary, line() builds the text
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(line())
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `rate` records per second for each message template, counts the rest
+    def __init__(self, rate=10.0):
+        super().__init__()
+        self.rate = rate
+        self.buckets = {}  # template -> [tokens, last refill, suppressed]
+
+    def filter(self, record):
+        now = time.monotonic()
+        bucket = self.buckets.setdefault(record.msg, [self.rate, now, 0])
+        bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = f"{record.msg} ({bucket[2]} similar messages suppressed)"
+            bucket[2] = 0
+        return True
+
+
+def setup_logging(level="INFO", rate=10.0):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handler.addFilter(RateLimitFilter(rate))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
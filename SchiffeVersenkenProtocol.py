@@ -0,0 +1,245 @@
+import struct
+
+from SchiffeVersenkenEngine import format_positions, parse_positions
+
+# Separator between the fields of each message in the text encoding, None means a single field
+FIELD_SEPARATORS = {
+    "GUESS": ":",
+    "RESULT": ",",
+    "HIT_ON_SHIP": ",",
+    "MISS_ON_SHIP": ",",
+    "SHOT": ",",
+}
+POSITION_MESSAGES = ("SHIP_POSITIONS", "OPPONENT_SHIP_POSITIONS")
+INVALID_GUESS = "invalid guess"  # ERROR text for a GUESS the server refused, a TURN follows it
+
+# Opcodes of the compact binary encoding, 0 carries any other message as "KIND:payload" text
+OPCODES = {
+    "PLAYER_ID": 1,
+    "COLOR": 2,
+    "WELCOME": 3,
+    "SHIP_POSITIONS": 4,
+    "OPPONENT_SHIP_POSITIONS": 5,
+    "TURN": 6,
+    "GUESS": 7,
+    "RESULT": 8,
+    "HIT_ON_SHIP": 9,
+    "MISS_ON_SHIP": 10,
+    "WIN": 11,
+    "CONFIG": 12,
+    "ERROR": 13,
+    # Public stream for spectators
+    "SPECTATE": 14,
+    "SHOT": 15,
+    "TURN_OF": 16,
+    "WINNER": 17,
+    "SNAPSHOT": 18,
+    "MATCHES": 19,
+    # Sessions and heartbeats
+    "SESSION": 20,
+    "RESUME": 21,
+    "RESUMED": 22,
+    "RESYNC": 23,
+    "OPPONENT": 24,
+    "PING": 25,
+    "PONG": 26,
+}
+KINDS = {opcode: kind for kind, opcode in OPCODES.items()}
+MAX_FRAME = 1 << 16  # Longest message accepted, a peer sending more is cut off
+
+_CELL = struct.Struct("!HH")
+_RESULT = struct.Struct("!HHB")
+_SHOT = struct.Struct("!BHHB")
+_FLAG = struct.Struct("!B")
+_NUMBER = struct.Struct("!I")
+
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+
+def _unpack(layout, buffer, body, frame_end):
+    # Fixed-size bodies must fill the frame exactly, stale buffer bytes behind a short frame are never read
+    if frame_end - body != layout.size:
+        raise ValueError(f"frame body of {frame_end - body} bytes, expected {layout.size}")
+    return layout.unpack_from(buffer, body)
+
+
+def _read_varint(buffer, pos, end):
+    # Returns (value, position after the varint) or (None, pos) if it is incomplete
+    value = shift = 0
+    while pos < end:
+        byte = buffer[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+    return None, pos
+
+
+class TextCodec:
+    name = "TEXT"
+
+    def encode(self, kind, fields):
+        if kind in POSITION_MESSAGES and not isinstance(fields[0], str):
+            fields = (format_positions(fields[0]),)
+        separator = FIELD_SEPARATORS.get(kind, ":")
+        return f"{kind}:{separator.join(map(str, fields))}\n".encode()
+
+    def decode(self, buffer, start, end):
+        # Returns ((kind, fields), next start) or (None, start) while the line is incomplete
+        newline = buffer.find(b"\n", start, end)
+        if newline < 0:
+            return None, start
+        kind, _, payload = buffer[start:newline].decode().strip().partition(":")
+        separator = FIELD_SEPARATORS.get(kind)
+        fields = payload.split(separator) if separator else [payload]
+        return (kind, fields), newline + 1
+
+
+class BinaryCodec:
+    # Frame: varint length, opcode byte, packed fields
+    name = "BINARY"
+
+    def encode(self, kind, fields):
+        opcode = OPCODES.get(kind, 0)
+        if kind in ("GUESS", "HIT_ON_SHIP", "MISS_ON_SHIP"):
+            body = _CELL.pack(int(fields[0]), int(fields[1]))
+        elif kind == "RESULT":
+            body = _RESULT.pack(int(fields[0]), int(fields[1]), fields[2] == "HIT")
+        elif kind in ("TURN", "WIN"):
+            body = _FLAG.pack(fields[0] == "YES")
+        elif kind == "SHOT":
+            body = _SHOT.pack(int(fields[0]), int(fields[1]), int(fields[2]), fields[3] == "HIT")
+        elif kind in ("PLAYER_ID", "TURN_OF", "WINNER", "RESUMED"):
+            body = _NUMBER.pack(int(fields[0]))
+        elif kind in POSITION_MESSAGES:
+            ships = parse_positions(fields[0]) if isinstance(fields[0], str) else fields[0]
+            body = _varint(len(ships))
+            for cells in ships:
+                body += _varint(len(cells))
+                for row, col in cells:
+                    body += _CELL.pack(row, col)
+        elif opcode:
+            body = ":".join(map(str, fields)).encode()
+        else:
+            body = f"{kind}:{':'.join(map(str, fields))}".encode()
+        return bytes(_varint(len(body) + 1)) + bytes((opcode,)) + bytes(body)
+
+    def decode(self, buffer, start, end):
+        length, pos = _read_varint(buffer, start, end)
+        if length is not None and not 0 < length <= MAX_FRAME:
+            raise ValueError(f"frame length {length}")
+        if length is None or pos + length > end:
+            return None, start
+        opcode, body, frame_end = buffer[pos], pos + 1, pos + length
+        kind = KINDS.get(opcode)
+        if kind in ("GUESS", "HIT_ON_SHIP", "MISS_ON_SHIP"):
+            fields = list(_unpack(_CELL, buffer, body, frame_end))
+        elif kind == "RESULT":
+            row, col, hit = _unpack(_RESULT, buffer, body, frame_end)
+            fields = [row, col, "HIT" if hit else "MISS"]
+        elif kind in ("TURN", "WIN"):
+            fields = ["YES" if _unpack(_FLAG, buffer, body, frame_end)[0] else "NO"]
+        elif kind == "SHOT":
+            player, row, col, hit = _unpack(_SHOT, buffer, body, frame_end)
+            fields = [player, row, col, "HIT" if hit else "MISS"]
+        elif kind in ("PLAYER_ID", "TURN_OF", "WINNER", "RESUMED"):
+            fields = list(_unpack(_NUMBER, buffer, body, frame_end))
+        elif kind in POSITION_MESSAGES:
+            fields = [format_positions(self._decode_ships(buffer, body, frame_end))]
+        elif kind:
+            fields = [buffer[body:frame_end].decode()]
+        else:
+            kind, _, payload = buffer[body:frame_end].decode().partition(":")
+            fields = [payload]
+        return (kind, fields), frame_end
+
+    @staticmethod
+    def _decode_ships(buffer, body, frame_end):
+        count, body = _read_varint(buffer, body, frame_end)
+        if count is None:
+            raise ValueError("incomplete ship count")
+        ships = []
+        for _ in range(count):
+            size, body = _read_varint(buffer, body, frame_end)
+            if size is None or body + size * _CELL.size > frame_end:
+                raise ValueError("ship runs past the end of the frame")
+            ships.append([_CELL.unpack_from(buffer, body + i * _CELL.size) for i in range(size)])
+            body += size * _CELL.size
+        if body != frame_end:
+            raise ValueError("bytes left after the last ship")
+        return ships
+
+
+TEXT = TextCodec()
+BINARY = BinaryCodec()
+CODECS = {TEXT.name: TEXT, BINARY.name: BINARY}
+
+
+class MessageStream:
+    # Framing for one connection: a reusable receive buffer and a batch of outgoing messages
+
+    def __init__(self, buffer_size=4096):
+        self.buffer = bytearray(buffer_size)
+        self.start = 0
+        self.end = 0
+        self.codec = TEXT  # Used for incoming messages
+        self.send_codec = TEXT
+        self.pending = []
+
+    def get_buffer(self, sizehint=-1):
+        # Free space after the unread bytes, moved to the front; grows for oversized messages
+        if self.start:
+            unread = self.end - self.start
+            self.buffer[:unread] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, unread
+        while len(self.buffer) - self.end < max(sizehint, 1):
+            self.buffer.extend(bytes(len(self.buffer)))
+        return memoryview(self.buffer)[self.end:]
+
+    def received(self, nbytes):
+        # Iterator over (kind, fields) of every complete message; the codec may be switched in between
+        self.end += nbytes
+        return self._messages()
+
+    def _messages(self):
+        while self.start < self.end:
+            message, self.start = self.codec.decode(self.buffer, self.start, self.end)
+            if message is None:
+                break
+            if message[0]:
+                yield message
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end - self.start > MAX_FRAME:
+            # A line that never ends would otherwise grow the buffer without bound
+            raise ValueError(f"message longer than {MAX_FRAME} bytes")
+
+    def feed(self, data):
+        self.get_buffer(len(data))[:len(data)] = data
+        return self.received(len(data))
+
+    def recv(self, sock):
+        # Blocking read from a socket straight into the receive buffer, None once the peer closed
+        nbytes = sock.recv_into(self.get_buffer())
+        if not nbytes:
+            return None
+        return self.received(nbytes)
+
+    def encode(self, kind, *fields):
+        return self.send_codec.encode(kind, fields)
+
+    def queue(self, kind, *fields):
+        self.pending.append(self.send_codec.encode(kind, fields))
+
+    def take_pending(self):
+        data = b"".join(self.pending)
+        self.pending.clear()
+        return data
@@ -1,95 +1,1034 @@
-import socket
-import threading
-
-class BattleshipServer:
-    def __init__(self, host='192.168.5.143', port=5555):
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server.bind((host, port))
-        self.server.listen(2)
-        print("Server started, waiting for players to connect...")
-
-        self.clients = []
-        self.lock = threading.Lock()
-        self.ship_positions = [None, None]
-        self.hits = [[], []]  # To track hits for each player
-        self.current_turn = 0  # 0 for player 1, 1 for player 2
-
-    def handle_client(self, client, player_id):
-        colors = ['blue', 'green']
-        client.sendall(f"PLAYER_ID:{player_id}\n".encode())
-        client.sendall(f"COLOR:{colors[player_id]}\n".encode())
-        client.sendall(f"WELCOME:Welcome Player {player_id+1}\n".encode())
-
-        while True:
-            try:
-                msg = client.recv(1024).decode().strip()
-                if msg.startswith("SHIP_POSITIONS:"):
-                    positions = msg[len("SHIP_POSITIONS:"):]
-                    self.ship_positions[player_id] = positions
-                    print(f"Received ship positions from Player {player_id+1}: {positions}")
-
-                    if all(self.ship_positions):
-                        self.send_opponent_positions()
-                        self.start_game()
-                elif msg.startswith("GUESS:"):
-                    guess = msg[len("GUESS:"):].split(":")
-                    row, col = int(guess[0]), int(guess[1])
-                    self.process_guess(player_id, row, col)
-            except Exception as e:
-                print(f"Error: {e}")
-                break
-
-        with self.lock:
-            self.clients.remove(client)
-        client.close()
-
-    def send_opponent_positions(self):
-        self.clients[0].sendall(f"OPPONENT_SHIP_POSITIONS:{self.ship_positions[1]}\n".encode())
-        self.clients[1].sendall(f"OPPONENT_SHIP_POSITIONS:{self.ship_positions[0]}\n".encode())
-        print("Sent opponent ship positions to both players.")
-
-    def start_game(self):
-        self.clients[0].sendall("TURN:YES\n".encode())
-        self.clients[1].sendall("TURN:NO\n".encode())
-
-    def process_guess(self, player_id, row, col):
-        opponent_id = 1 if player_id == 0 else 0
-        opponent_positions = self.ship_positions[opponent_id].split(',')
-        guess_result = "HIT" if f"{row}:{col}" in opponent_positions else "MISS"
-
-        # Send the result to the player who made the guess
-        self.clients[player_id].sendall(f"RESULT:{row},{col},{guess_result}\n".encode())
-
-        # Notify the opponent if their ship was hit or missed
-        if guess_result == "HIT":
-            self.clients[opponent_id].sendall(f"HIT_ON_SHIP:{row},{col}\n".encode())
-            self.hits[player_id].append(f"{row}:{col}")
-            if self.check_win(player_id, opponent_positions):
-                self.clients[player_id].sendall("WIN:YES\n".encode())
-                self.clients[opponent_id].sendall("WIN:NO\n".encode())
-                return  # End the game after a win
-        else:
-            self.clients[opponent_id].sendall(f"MISS_ON_SHIP:{row},{col}\n".encode())
-
-        if guess_result == "MISS":
-            self.current_turn = opponent_id
-
-        self.clients[self.current_turn].sendall("TURN:YES\n".encode())
-        self.clients[1 - self.current_turn].sendall("TURN:NO\n".encode())
-
-    def check_win(self, player_id, opponent_positions):
-        # Check if all ships of the opponent are hit
-        return all(pos in self.hits[player_id] for pos in opponent_positions)
-
-    def start(self):
-        player_id = 0
-        while len(self.clients) < 2:
-            client, addr = self.server.accept()
-            self.clients.append(client)
-            threading.Thread(target=self.handle_client, args=(client, player_id)).start()
-            print(f"Player {player_id+1} connected from {addr}")
-            player_id += 1
-
-if __name__ == "__main__":
-    server = BattleshipServer()
-    server.start()
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+from SchiffeVersenkenEngine import CLIENT_FLEET, HIT, MISS, Game, GameConfig, format_positions
+from SchiffeVersenkenEventLog import EventLog
+from SchiffeVersenkenMetrics import Registry, log_stats, serve_metrics, setup_logging
+from SchiffeVersenkenProtocol import CODECS, INVALID_GUESS, OPCODES, TEXT, MessageStream
+
+log = logging.getLogger("schiffeversenken.server")
+
+metrics = Registry()
+CONNECTIONS = metrics.gauge("battleship_connections", "Open player connections")
+MATCHES = metrics.gauge("battleship_matches", "Matches in the lobby or in play")
+MESSAGES_IN = metrics.counter("battleship_messages_received_total", "Messages received by type", "type")
+MESSAGES_OUT = metrics.counter("battleship_messages_sent_total", "Messages sent by type", "type")
+BYTES_IN = metrics.counter("battleship_bytes_received_total", "Bytes read from player sockets")
+BYTES_OUT = metrics.counter("battleship_bytes_sent_total", "Bytes written to player sockets")
+RESUMES = metrics.counter("battleship_resumes_total", "Sessions resumed, by how the player was brought up to date", "sync")
+REAPED = metrics.counter("battleship_reaped_connections_total", "Connections closed for missing heartbeats")
+ERRORS = metrics.counter("battleship_errors_total", "Connections dropped because of bad messages", "type")
+REJECTED_FLEETS = metrics.counter("battleship_rejected_fleets_total", "SHIP_POSITIONS refused by validation")
+REJECTED_GUESSES = metrics.counter("battleship_rejected_guesses_total",
+                                   "GUESSes out of turn, off the board or at a cell already fired at")
+SPECTATORS = metrics.gauge("battleship_spectators", "Open spectator connections")
+LAGGING_SPECTATORS = metrics.counter("battleship_lagging_spectators_total",
+                                     "Spectators whose send queue overflowed, by what was done", "policy")
+HANDLER_SECONDS = metrics.histogram("battleship_handler_seconds", "Time spent in message handlers", "handler")
+
+# Only the supervisor of a multi-process server fills these, next to the sums of its workers' metrics
+cluster = Registry()
+HANDOFFS = cluster.counter("battleship_handoffs_total", "Sockets handed to a worker process", "worker")
+WORKERS_UP = cluster.gauge("battleship_worker_up", "1 while the worker reports its stats in time", "worker")
+RESTARTS = cluster.counter("battleship_worker_restarts_total", "Worker processes started again after exiting", "worker")
+REPORT_INTERVAL = 1.0  # Seconds between the stats reports of a worker to its supervisor
+SEAT_DELAY = 0.2  # Seconds a new connection has to send RESUME before it is seated in the lobby
+
+
+def message_label(kind):
+    # Kinds come from the client, only known ones get their own series
+    return kind if kind in OPCODES or kind == "ENCODING" else "other"
+
+
+def stats_line():
+    guess_p99 = HANDLER_SECONDS.quantile(0.99, "process_guess")
+    return (f"connections={CONNECTIONS.total()} spectators={SPECTATORS.total()} matches={MATCHES.total()} "
+            f"messages_in={MESSAGES_IN.total()} messages_out={MESSAGES_OUT.total()} "
+            f"bytes_out={BYTES_OUT.total()} errors={ERRORS.total()} guess_p99<={guess_p99 * 1e6:.0f}us")
+
+
+class Match:
+    colors = ['blue', 'green']
+
+    def __init__(self, match_id, config=None, journal=None):
+        self.match_id = match_id
+        self.config = config or GameConfig()
+        self.journal = journal  # EventLog or None
+        self.clients = [None, None]
+        self.spectators = set()
+        self.tokens = [None, None]  # Session token of each player, see BattleshipServer.resume
+        self.ship_positions = [None, None]  # Parsed fleet of each player
+        self.legacy = [False, False]  # Sent a comma-only fleet, gets the opponent's fleet the same way
+        self.game = Game(self.config.size, self.config.adjacent)
+        self.history = []  # (shooter, row, col, hit) of every legal shot, a player's seq counts into it
+        self.history_base = 0  # Shots before history[0], all shots before a recovery only come back as RESYNC
+        self.expiry = None  # Timer that ends the match unless a disconnected player resumes
+        self.started = False
+        self.finished = False
+
+    def restore(self, state):
+        # Picks up a match recovered from the event log
+        self.game = state.game
+        self.ship_positions = [fleet or None for fleet in state.fleets]
+        self.started = state.started
+        self.finished = state.finished
+        self.tokens = list(state.tokens)
+        self.history_base = sum(len(board.shots) for board in self.game.boards)
+
+    def is_full(self):
+        return all(self.clients)
+
+    def is_empty(self):
+        return not any(self.clients)
+
+    def join(self, connection):
+        player_id = self.clients.index(None)
+        self.clients[player_id] = connection
+        self.send(player_id, "PLAYER_ID", player_id)
+        self.send(player_id, "COLOR", self.colors[player_id])
+        self.send(player_id, "WELCOME", f"Welcome Player {player_id+1}")
+        self.send(player_id, "CONFIG", self.config.to_text())
+        return player_id
+
+    def leave(self, player_id):
+        self.clients[player_id] = None
+        if not self.started:
+            self.ship_positions[player_id] = None
+            self.legacy[player_id] = False
+            self.game.place_fleet(player_id, [])
+            if self.journal:
+                self.journal.fleet(self.match_id, player_id, [])
+
+    def send(self, player_id, kind, *fields):
+        client = self.clients[player_id]
+        if client is not None:
+            client.send(kind, *fields)
+
+    def resume(self, player_id, connection, seq):
+        # Brings a returning player up to date with the shots it missed, or a bitboard RESYNC if that is shorter
+        self.clients[player_id] = connection
+        self.send(player_id, "RESUMED", player_id)
+        self.send(player_id, "COLOR", self.colors[player_id])
+        messages = None
+        if self.history_base <= seq <= self.history_base + len(self.history):
+            messages = [self.shot_message(player_id, *shot) for shot in self.history[seq - self.history_base:]]
+        resync = ("RESYNC", self.resync(player_id))
+        stream = connection.stream
+        if messages is None or sum(len(stream.encode(*message)) for message in messages) > len(stream.encode(*resync)):
+            messages = [resync]
+        RESUMES.inc(1, "resync" if messages and messages[0] is resync else "delta")
+        for message in messages:
+            self.send(player_id, *message)
+        if self.ship_positions[1 - player_id]:
+            self.send_opponent_positions(player_id)
+        if self.started:
+            self.send(player_id, "TURN", "YES" if self.game.current_player == player_id else "NO")
+        self.send(1 - player_id, "OPPONENT", "RECONNECTED")
+
+    def shot_message(self, player_id, shooter, row, col, hit):
+        # The message player_id got for this shot when it happened
+        if shooter == player_id:
+            return "RESULT", row, col, HIT if hit else MISS
+        return "HIT_ON_SHIP" if hit else "MISS_ON_SHIP", row, col
+
+    def resync(self, player_id):
+        # seq|size|hits on own ships|misses on own board|own hits|own misses, bitboards as hex
+        seq = self.history_base + len(self.history)
+        parts = [str(seq), str(self.config.size)]
+        for board in (self.game.boards[player_id], self.game.boards[1 - player_id]):
+            hits = board.mask(pos for pos in board.shots if pos in board.cells)
+            misses = board.mask(pos for pos in board.shots if pos not in board.cells)
+            parts += [f"{hits:x}", f"{misses:x}"]
+        return "|".join(parts)
+
+    def broadcast(self, kind, *fields):
+        # Public event for the spectators: encoded once per codec, the same bytes are queued for everyone
+        if not self.spectators:
+            return
+        frames = {}
+        for spectator in self.spectators:
+            codec = spectator.stream.send_codec
+            frame = frames.get(codec)
+            if frame is None:
+                frame = frames[codec] = codec.encode(kind, fields)
+            spectator.push(frame)
+        MESSAGES_OUT.inc(len(self.spectators), kind)
+
+    def snapshot(self):
+        # turn|winner|hits on board 0|misses on board 0|hits on board 1|misses on board 1, ship positions stay hidden
+        parts = [str(self.game.current_player) if self.started else "-",
+                 "-" if self.game.winner is None else str(self.game.winner)]
+        for board in self.game.boards:
+            hits = sorted(pos for pos in board.shots if pos in board.cells)
+            misses = sorted(pos for pos in board.shots if pos not in board.cells)
+            parts += [format_positions([hits]) if hits else "-", format_positions([misses]) if misses else "-"]
+        return "|".join(parts)
+
+    def handle_message(self, player_id, kind, fields):
+        if kind == "SHIP_POSITIONS":
+            positions = fields[0]
+            if self.started or self.ship_positions[player_id]:
+                return  # The fleet is fixed once placed
+            ships = self.config.parse_ships(positions)
+            start = time.perf_counter()
+            error = self.config.validate(ships)
+            HANDLER_SECONDS.observe(time.perf_counter() - start, "validate_fleet")
+            if error:
+                REJECTED_FLEETS.inc()
+                log.info("Match %s: rejected ship positions of Player %s: %s", self.match_id, player_id + 1, error)
+                self.send(player_id, "ERROR", error)
+                return
+            self.game.place_fleet(player_id, ships)
+            if self.journal:
+                self.journal.fleet(self.match_id, player_id, ships)
+            self.ship_positions[player_id] = ships
+            self.legacy[player_id] = ";" not in positions
+            log.debug("Match %s: received ship positions from Player %s", self.match_id, player_id + 1)
+
+            if all(self.ship_positions) and self.is_full():
+                start = time.perf_counter()
+                self.send_opponent_positions(0)
+                self.send_opponent_positions(1)
+                HANDLER_SECONDS.observe(time.perf_counter() - start, "send_opponent_positions")
+                self.start_game()
+        elif kind == "GUESS":
+            row, col = int(fields[0]), int(fields[1])
+            if self.started and not self.finished:
+                start = time.perf_counter()
+                self.process_guess(player_id, row, col)
+                HANDLER_SECONDS.observe(time.perf_counter() - start, "process_guess")
+
+    def send_opponent_positions(self, player_id):
+        ships = self.ship_positions[1 - player_id]
+        if self.legacy[player_id]:
+            # The baseline client reads one comma list of cells
+            ships = ",".join(f"{r}:{c}" for cells in ships for r, c in cells)
+        self.send(player_id, "OPPONENT_SHIP_POSITIONS", ships)
+
+    def start_game(self):
+        self.started = True
+        self.send(0, "TURN", "YES")
+        self.send(1, "TURN", "NO")
+        self.broadcast("TURN_OF", 0)
+
+    def process_guess(self, player_id, row, col):
+        opponent_id = 1 if player_id == 0 else 0
+        result = self.game.shoot(player_id, row, col)
+        if result is None:
+            # Not this player's turn, off the board or already fired at. Clients wait for a TURN after every
+            # GUESS, so the shooter is told whose turn it still is
+            REJECTED_GUESSES.inc()
+            self.send(player_id, "ERROR", INVALID_GUESS)
+            self.send(player_id, "TURN", "YES" if self.game.current_player == player_id else "NO")
+            return
+        hit, _, won = result
+        self.history.append((player_id, row, col, hit))
+        if self.journal:
+            self.journal.shot(self.match_id, player_id, row, col)
+        guess_result = HIT if hit else MISS
+
+        # Send the result to the player who made the guess
+        self.send(player_id, "RESULT", row, col, guess_result)
+        self.broadcast("SHOT", player_id, row, col, guess_result)
+
+        # Notify the opponent if their ship was hit or missed
+        if hit:
+            self.send(opponent_id, "HIT_ON_SHIP", row, col)
+            if won:
+                self.send(player_id, "WIN", "YES")
+                self.send(opponent_id, "WIN", "NO")
+                self.broadcast("WINNER", player_id)
+                self.finished = True
+                return  # End the game after a win
+        else:
+            self.send(opponent_id, "MISS_ON_SHIP", row, col)
+
+        current_turn = self.game.current_player
+        self.send(current_turn, "TURN", "YES")
+        self.send(1 - current_turn, "TURN", "NO")
+        self.broadcast("TURN_OF", current_turn)
+
+
+class Connection(asyncio.BufferedProtocol):
+    # One player socket: reads into the stream's reusable buffer, replies are batched per read
+
+    def __init__(self, server, resume=None):
+        self.server = server
+        self.stream = MessageStream()
+        self.transport = None
+        self.match = None
+        self.player_id = None
+        self.last_seen = 0.0
+        self.answered = False  # Has sent a PONG, so its client knows PING and silence means it is gone
+        self.replaced = False  # Its session was resumed on another connection
+        self.resume = resume  # (codec, token, seq) of a session another worker handed over
+        self.seat_timer = None  # Pending until the connection is seated or has resumed a session
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.last_seen = asyncio.get_running_loop().time()
+        self.server.connections.add(self)
+        CONNECTIONS.inc()
+        if self.resume:
+            codec, token, seq = self.resume
+            self.stream.codec = self.stream.send_codec = CODECS.get(codec, TEXT)
+            self.server.resume(self, token, seq)
+        else:
+            # A reconnecting client sends RESUME first. Everyone else is seated on their first other message or
+            # after SEAT_DELAY, so a resume never opens or fills a match in the lobby
+            self.seat_timer = asyncio.get_running_loop().call_later(SEAT_DELAY, self.seat)
+        self.server.flush()
+
+    def seat(self):
+        self.seat_timer.cancel()
+        self.seat_timer = None
+        self.match, self.player_id = self.server.join_lobby(self)
+        addr = self.transport.get_extra_info('peername')
+        log.info("Player %s of match %s connected from %s", self.player_id + 1, self.match.match_id, addr)
+        self.server.flush()
+
+    def get_buffer(self, sizehint):
+        return self.stream.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        BYTES_IN.inc(nbytes)
+        self.last_seen = asyncio.get_running_loop().time()
+        try:
+            for kind, fields in self.stream.received(nbytes):
+                MESSAGES_IN.inc(1, message_label(kind))
+                if kind == "ENCODING":
+                    self.negotiate(fields[0])
+                elif kind == "RESUME":
+                    if self.seat_timer is not None:
+                        self.seat_timer.cancel()
+                        self.seat_timer = None
+                        self.server.skip_lobby()
+                    token, _, seq = fields[0].partition(":")
+                    self.server.resume(self, token, int(seq or 0))
+                elif kind == "PING":
+                    self.send("PONG")
+                elif kind == "PONG":
+                    self.answered = True
+                else:
+                    if self.seat_timer is not None:
+                        self.seat()
+                    self.match.handle_message(self.player_id, kind, fields)
+        except (ValueError, IndexError, KeyError) as e:
+            ERRORS.inc(1, type(e).__name__)
+            if self.match is None:
+                log.warning("Dropping connection before it took a seat: %r", e)
+            else:
+                log.warning("Dropping player %s of match %s: %r", self.player_id + 1, self.match.match_id, e)
+            self.transport.close()
+        self.server.flush()
+        if self.match is not None and self.match.finished:
+            self.server.close_match(self.match)
+
+    def negotiate(self, name):
+        # The answer still goes out in the old encoding, everything after it in the new one
+        codec = CODECS.get(name, TEXT)
+        self.send("ENCODING", codec.name)
+        self.stream.codec = self.stream.send_codec = codec
+
+    def connection_lost(self, exc):
+        CONNECTIONS.dec()
+        self.server.connections.discard(self)
+        if self.seat_timer is not None:
+            self.seat_timer.cancel()
+            self.server.skip_lobby()
+        if self.match is not None and not self.replaced:
+            self.server.leave_match(self.match, self.player_id)
+        self.server.flush()
+
+    def send(self, kind, *fields):
+        if not self.stream.pending:
+            self.server.dirty.append(self)
+        MESSAGES_OUT.inc(1, kind)
+        self.stream.queue(kind, *fields)
+
+    def flush(self):
+        data = self.stream.take_pending()
+        if data and not self.transport.is_closing():
+            BYTES_OUT.inc(len(data))
+            self.transport.write(data)
+
+    def close(self):
+        self.transport.close()
+
+
+class Spectator(asyncio.BufferedProtocol):
+    # Follows one match read-only. Frames wait in a bounded queue while the socket is backed up; a spectator
+    # that falls further behind is dropped or, with the snapshot policy, skips ahead to a fresh SNAPSHOT
+
+    def __init__(self, server):
+        self.server = server
+        self.stream = MessageStream()
+        self.transport = None
+        self.match = None
+        self.queued = 0  # Bytes in stream.pending
+        self.paused = False  # The transport's own buffer is above its high-water mark
+        self.lagging = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.server.spectator_queue // 4)
+        SPECTATORS.inc()
+
+    def get_buffer(self, sizehint):
+        return self.stream.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        BYTES_IN.inc(nbytes)
+        try:
+            for kind, fields in self.stream.received(nbytes):
+                MESSAGES_IN.inc(1, message_label(kind))
+                if kind == "ENCODING":
+                    codec = CODECS.get(fields[0], TEXT)
+                    self.send("ENCODING", codec.name)
+                    self.stream.codec = self.stream.send_codec = codec
+                elif kind == "SPECTATE":
+                    self.server.spectate(self, fields[0])
+        except (ValueError, IndexError, KeyError) as e:
+            ERRORS.inc(1, type(e).__name__)
+            self.transport.close()
+        self.server.flush()
+
+    def connection_lost(self, exc):
+        SPECTATORS.dec()
+        if self.match is not None:
+            self.match.spectators.discard(self)
+
+    def send(self, kind, *fields):
+        MESSAGES_OUT.inc(1, kind)
+        self.push(self.stream.encode(kind, *fields))
+
+    def push(self, frame):
+        if self.lagging:
+            return
+        if not self.stream.pending:
+            self.server.dirty.append(self)
+        self.stream.pending.append(frame)
+        self.queued += len(frame)
+        if self.queued > self.server.spectator_queue:
+            self.fall_behind()
+
+    def fall_behind(self):
+        LAGGING_SPECTATORS.inc(1, self.server.lag_policy)
+        self.stream.pending.clear()
+        self.queued = 0
+        if self.server.lag_policy == "drop":
+            self.lagging = True
+            self.transport.abort()
+        elif self.paused:
+            self.lagging = True  # A snapshot goes out once the socket drains
+        else:
+            self.send_snapshot()
+
+    def send_snapshot(self):
+        if self.match is not None:
+            self.send("SNAPSHOT", self.match.snapshot())
+
+    def flush(self):
+        if self.paused or self.transport.is_closing():
+            return  # Stays queued, resume_writing sends it
+        data = self.stream.take_pending()
+        self.queued = 0
+        if data:
+            BYTES_OUT.inc(len(data))
+            self.transport.write(data)
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        if self.lagging:
+            self.lagging = False
+            self.send_snapshot()
+        self.flush()
+
+    def close(self):
+        self.transport.close()
+
+
+class BattleshipServer:
+    def __init__(self, host='192.168.5.143', port=5555, metrics_port=None, stats_interval=None, config=None,
+                 event_log=None, spectator_port=None, spectator_queue=65536, lag_policy="snapshot",
+                 resume_timeout=60.0, heartbeat=10.0, worker=None, control=None):
+        self.host = host
+        self.port = port
+        # As one of several worker processes: (index, count) and the Unix socket to the Supervisor,
+        # which hands over accepted sockets instead of this server listening itself
+        self.worker = worker
+        self.control = control
+        self.joined = 0  # Players that joined the lobby, the supervisor matches its handoffs against it
+        self.reported = None  # (joined, open seats) last sent to the supervisor
+        self.resume_timeout = resume_timeout  # Seconds a started match waits for a disconnected player, 0 ends it
+        self.heartbeat = heartbeat  # Seconds between PINGs, a player silent for three of them is dropped
+        self.sessions = {}  # token -> (match, player id)
+        self.connections = set()
+        self.spectator_port = spectator_port
+        self.spectator_queue = spectator_queue  # Bytes a spectator may fall behind before lag_policy applies
+        self.lag_policy = lag_policy  # "snapshot" or "drop"
+        self.config = config or GameConfig()
+        self.event_log = event_log  # Path of the append-only match log, None keeps no log
+        self.journal = None
+        self.metrics_port = metrics_port
+        self.stats_interval = stats_interval
+        self.matches = {}
+        self.lobby = deque()  # Matches waiting for a second player
+        self.match_ids = self.match_id_counter(1)
+        self.dirty = []  # Connections with queued replies
+
+    def match_id_counter(self, first):
+        # Workers take every count-th id, so match ids stay unique and tell which worker has the match
+        if not self.worker:
+            return itertools.count(first)
+        index, count = self.worker
+        return itertools.count(first + (index + 1 - first) % count, count)
+
+    def flush(self):
+        # One write per connection for everything queued while handling a read
+        dirty, self.dirty = self.dirty, []
+        for connection in dirty:
+            connection.flush()
+        if self.control:
+            self.report_lobby()
+
+    def report_lobby(self):
+        # Tells the supervisor how many matches wait for a second player, so it sends the next player here
+        seats = sum(1 for match in self.lobby if match.match_id in self.matches and not match.is_full())
+        if (self.joined, seats) != self.reported:
+            self.reported = (self.joined, seats)
+            self.send_control(f"lobby {self.joined} {seats}".encode())
+
+    def send_control(self, message, fds=()):
+        try:
+            socket.send_fds(self.control, [message], list(fds))
+        except OSError as e:
+            log.warning("Worker %s: message to the supervisor lost: %r", self.worker[0] + 1, e)
+
+    def skip_lobby(self):
+        # The supervisor counts every player socket it hands over; one that resumed or left before taking a
+        # seat is counted here too, so the lobby reports stay in step
+        self.joined += 1
+
+    def join_lobby(self, connection):
+        # Pair incoming connections: the first player opens a match, the second one fills it
+        while self.lobby and self.lobby[0].match_id not in self.matches:
+            self.lobby.popleft()
+        if self.lobby:
+            match = self.lobby[0]
+        else:
+            match = Match(next(self.match_ids), self.config, self.journal)
+            self.matches[match.match_id] = match
+            if self.journal:
+                self.journal.match_started(match.match_id, self.config)
+            MATCHES.set(len(self.matches))
+            self.lobby.append(match)
+        player_id = match.join(connection)
+        self.joined += 1
+        self.new_session(match, player_id)
+        if match.is_full():
+            self.lobby.popleft()
+        return match, player_id
+
+    def new_session(self, match, player_id):
+        # Issued right after PLAYER_ID, RESUME:<token>:<seq> on a new connection takes the seat back
+        token = secrets.token_hex(8)
+        if self.worker:
+            token = f"{self.worker[0]}-{token}"  # The supervisor routes RESUME to the worker owning the session
+        self.sessions[token] = (match, player_id)
+        match.tokens[player_id] = token
+        match.send(player_id, "SESSION", token)
+        if self.journal:
+            self.journal.session(match.match_id, player_id, token)
+
+    def leave_match(self, match, player_id):
+        was_full = match.is_full()
+        match.leave(player_id)
+        if match.started:
+            if match.finished or not self.resume_timeout:
+                # The remaining player has nobody to play against anymore
+                self.close_match(match)
+                return
+            # Hold the seat so the player can come back with its session token
+            match.send(1 - player_id, "OPPONENT", "DISCONNECTED")
+            if match.expiry is None:
+                match.expiry = asyncio.get_running_loop().call_later(self.resume_timeout, self.expire, match)
+            return
+        self.sessions.pop(match.tokens[player_id], None)
+        match.tokens[player_id] = None
+        if was_full:
+            # Opponent left before the game started, put the match back into the lobby
+            self.lobby.append(match)
+        if match.is_empty():
+            self.remove_match(match)
+
+    def expire(self, match):
+        match.expiry = None
+        if not match.is_full():
+            log.info("Match %s: no resume within %ss, closing", match.match_id, self.resume_timeout)
+            self.close_match(match)
+            self.flush()
+
+    def resume(self, connection, token, seq):
+        session = self.sessions.get(token)
+        owner = self.session_owner(token)
+        if session is None and owner is not None:
+            self.hand_over(connection, owner, token, seq)
+            return
+        if session is None or session[0] is connection.match:
+            connection.send("ERROR", "unknown session")
+            if connection.match is None:
+                connection.flush()
+                connection.close()
+            return
+        match, player_id = session
+        if connection.match is not None:
+            # Give up the lobby seat this connection took before its RESUME arrived
+            self.leave_match(connection.match, connection.player_id)
+        previous = match.clients[player_id]
+        if previous is not None:
+            # The old socket is half-open, the player is already back on a new one
+            previous.replaced = True
+            previous.transport.abort()
+        connection.match, connection.player_id = match, player_id
+        match.resume(player_id, connection, seq)
+        if match.is_full() and match.expiry is not None:
+            match.expiry.cancel()
+            match.expiry = None
+        log.info("Player %s of match %s resumed at seq %s", player_id + 1, match.match_id, seq)
+
+    def session_owner(self, token):
+        # Index of the other worker that issued the token, None if it is ours or there are no workers
+        index, separator, _ = token.partition("-")
+        if not self.worker or not separator or not index.isdigit():
+            return None
+        index = int(index)
+        return index if index != self.worker[0] and index < self.worker[1] else None
+
+    def hand_over(self, connection, owner, token, seq):
+        # The session lives in another worker: give up our lobby seat, if any, and pass the socket on via the
+        # supervisor
+        if connection.match is not None:
+            self.leave_match(connection.match, connection.player_id)
+        connection.replaced = True
+        sock = connection.transport.get_extra_info("socket")
+        self.send_control(f"resume {owner} {connection.stream.codec.name} {token}:{seq}".encode(), [sock.fileno()])
+        connection.transport.abort()
+
+    def on_control(self):
+        # Sockets from the supervisor: new players, sessions resumed from another worker, spectators
+        try:
+            message, fds, _, _ = socket.recv_fds(self.control, 1 << 16, 1)
+        except BlockingIOError:
+            return
+        if not message:
+            log.info("Worker %s: supervisor gone, shutting down", self.worker[0] + 1)
+            asyncio.get_running_loop().remove_reader(self.control)
+            self.stop()
+            return
+        kind, _, rest = message.partition(b" ")
+        sock = socket.socket(fileno=fds[0])
+        if kind == b"player":
+            asyncio.create_task(self.adopt(sock, lambda: Connection(self), player=True))
+        elif kind == b"resume":
+            codec, session = rest.decode().split(" ")
+            token, _, seq = session.partition(":")
+            asyncio.create_task(self.adopt(sock, lambda: Connection(self, (codec, token, int(seq or 0)))))
+        elif kind == b"spectate":
+            asyncio.create_task(self.adopt(sock, lambda: Spectator(self), rest))
+        else:
+            sock.close()
+
+    async def adopt(self, sock, factory, data=b"", player=False):
+        try:
+            _, protocol = await asyncio.get_running_loop().connect_accepted_socket(factory, sock)
+        except OSError as e:
+            log.info("Worker %s: handed over socket already closed: %r", self.worker[0] + 1, e)
+            sock.close()
+            if player:
+                self.joined += 1  # Keeps the count in step with the supervisor's handoffs
+                self.report_lobby()
+            return
+        if data:
+            # Bytes the supervisor read to find out where the socket belongs
+            protocol.get_buffer(len(data))[:len(data)] = data
+            protocol.buffer_updated(len(data))
+
+    async def report(self):
+        while True:
+            self.send_control(b"stats " + json.dumps(metrics.dump()).encode())
+            await asyncio.sleep(REPORT_INTERVAL)
+
+    async def reap(self):
+        # Every heartbeat each player gets a PING; a player that answered one before and stayed silent for three
+        # heartbeats is dropped. Clients that never answer (older ones do not know PING) are only dropped when a
+        # write to them fails, waiting for a move can take longer than any heartbeat
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            deadline = loop.time() - 3 * self.heartbeat
+            for connection in list(self.connections):
+                if connection.answered and connection.last_seen < deadline:
+                    REAPED.inc()
+                    connection.transport.abort()
+                else:
+                    connection.send("PING")
+            self.flush()
+
+    def close_match(self, match):
+        match.finished = True
+        self.remove_match(match)
+        for connection in match.clients:
+            if connection is not None:
+                connection.close()
+        for spectator in list(match.spectators):
+            spectator.close()
+
+    def spectate(self, spectator, match_id):
+        match = self.matches.get(int(match_id)) if match_id.isdigit() else None
+        if match is None:
+            spectator.send("ERROR", "no such match")
+            spectator.send("MATCHES", ",".join(map(str, sorted(self.matches))))
+            return
+        if spectator.match is not None:
+            spectator.match.spectators.discard(spectator)
+        spectator.match = match
+        match.spectators.add(spectator)
+        spectator.send_snapshot()
+
+    def remove_match(self, match):
+        if self.matches.pop(match.match_id, None) is not None and self.journal:
+            self.journal.match_ended(match.match_id, match.game.winner)
+        MATCHES.set(len(self.matches))
+        for token in match.tokens:
+            self.sessions.pop(token, None)
+        if match.expiry is not None:
+            match.expiry.cancel()
+            match.expiry = None
+
+    def recover(self):
+        # Rebuilds the matches that were in play when the previous server stopped
+        self.journal = EventLog(self.event_log)
+        for match_id, state in self.journal.recovered.items():
+            match = Match(match_id, state.config, self.journal)
+            match.restore(state)
+            self.matches[match_id] = match
+            for player_id, token in enumerate(match.tokens):
+                if token:
+                    self.sessions[token] = (match, player_id)
+            # Nobody is seated yet: a match whose players do not come back, started or not, is ended on expiry
+            match.expiry = asyncio.get_running_loop().call_later(self.resume_timeout or 60.0, self.expire, match)
+        self.match_ids = self.match_id_counter(self.journal.last_match_id + 1)
+        MATCHES.set(len(self.matches))
+        log.info("Event log %s: %s matches recovered", self.event_log, len(self.journal.recovered))
+        if self.journal.archived:
+            log.info("Event log: previous segment kept as %s", self.journal.archived)
+
+    def stop(self):
+        if not self.stopped.done():
+            self.stopped.set_result(None)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        try:
+            # SIGTERM ends serving like the supervisor going away does, so the event log is closed cleanly
+            loop.add_signal_handler(signal.SIGTERM, self.stop)
+        except NotImplementedError:
+            pass  # Not on Windows
+        if self.event_log:
+            self.recover()
+            self.journal.start()
+        if self.control:
+            await self.serve_worker()
+            return
+        server = await loop.create_server(lambda: Connection(self), self.host, self.port, backlog=1024)
+        log.info("Server started, waiting for players to connect...")
+        if self.spectator_port:
+            await loop.create_server(lambda: Spectator(self), self.host, self.spectator_port, backlog=1024)
+            log.info("Spectators on port %s", self.spectator_port)
+        if self.metrics_port:
+            await serve_metrics(metrics, "127.0.0.1", self.metrics_port)
+            log.info("Metrics on http://127.0.0.1:%s/metrics", self.metrics_port)
+        if self.heartbeat:
+            self.reap_task = asyncio.create_task(self.reap())
+        if self.stats_interval:
+            self.stats_task = asyncio.create_task(log_stats(log, self.stats_interval, stats_line))
+        try:
+            async with server:
+                await self.stopped
+        finally:
+            if self.journal:
+                self.journal.close()
+
+    async def serve_worker(self):
+        # Runs until the supervisor closes the control socket; ports, metrics and stats are the supervisor's
+        loop = asyncio.get_running_loop()
+        self.control.setblocking(False)
+        loop.add_reader(self.control, self.on_control)
+        self.report_task = asyncio.create_task(self.report())
+        if self.heartbeat:
+            self.reap_task = asyncio.create_task(self.reap())
+        log.info("Worker %s of %s ready", self.worker[0] + 1, self.worker[1])
+        try:
+            await self.stopped
+        finally:
+            if self.journal:
+                self.journal.close()
+
+    def start(self):
+        asyncio.run(self.serve())
+
+
+class WorkerProcess:
+    # A BattleshipServer in its own interpreter, started from the same command line plus --worker
+    def __init__(self, index, count, argv):
+        self.index = index
+        self.count = count
+        self.argv = argv
+        self.process = None
+        self.control = None  # SOCK_SEQPACKET Unix socket, one message per handoff or report
+        self.sent = 0  # Players handed over since the start
+        self.seats = 0  # Matches waiting for a second player, as far as the supervisor knows
+        self.metrics = {}  # Last Registry.dump() the worker reported
+        self.reported = 0.0
+
+    def start(self):
+        self.control, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        command = [sys.executable, __file__, *self.argv,
+                   "--worker", f"{self.index}/{self.count}", "--control-fd", str(child.fileno())]
+        self.process = subprocess.Popen(command, pass_fds=[child.fileno()])
+        child.close()
+        self.control.setblocking(False)
+        self.sent = self.seats = 0
+        self.metrics = {}
+        self.reported = time.monotonic()
+
+    def alive(self):
+        return self.process.poll() is None
+
+
+class Supervisor:
+    # Spreads the server over several processes, each with its own event loop, matches and event log.
+    # The supervisor accepts every connection and passes the socket to a worker (SCM_RIGHTS); a worker
+    # reports its open lobby seats, so the second player of a match lands in the worker holding the first.
+    # RESUME and SPECTATE find the right worker by the worker index in the session token and the match id
+    def __init__(self, workers, argv, host='192.168.5.143', port=5555, metrics_port=None, stats_interval=None,
+                 spectator_port=None):
+        self.workers = [WorkerProcess(index, workers, argv) for index in range(workers)]
+        self.host = host
+        self.port = port
+        self.metrics_port = metrics_port
+        self.stats_interval = stats_interval
+        self.spectator_port = spectator_port
+        self.next_worker = itertools.count()
+
+    def pick(self):
+        # A worker with a player waiting for an opponent, else the next one in turn opens a match
+        alive = [worker for worker in self.workers if worker.alive()]
+        if not alive:
+            return None
+        for worker in alive:
+            if worker.seats > 0:
+                worker.seats -= 1
+                break
+        else:
+            worker = alive[next(self.next_worker) % len(alive)]
+            worker.seats += 1
+        worker.sent += 1
+        return worker
+
+    def hand_over(self, worker, message, client):
+        try:
+            if worker is None:
+                raise OSError("no worker running")
+            socket.send_fds(worker.control, [message], [client.fileno()])
+            HANDOFFS.inc(1, worker.index)
+        except OSError as e:
+            log.warning("Dropping connection, handoff failed: %r", e)
+        finally:
+            client.close()
+
+    def accept_players(self, listener):
+        for _ in range(64):
+            try:
+                client, _ = listener.accept()
+            except BlockingIOError:
+                return
+            self.hand_over(self.pick(), b"player", client)
+
+    def accept_spectators(self, listener):
+        for _ in range(64):
+            try:
+                client, _ = listener.accept()
+            except BlockingIOError:
+                return
+            asyncio.create_task(self.route_spectator(client))
+
+    async def route_spectator(self, client):
+        # Reads up to SPECTATE:<match id>; the worker gets those bytes along with the socket
+        loop = asyncio.get_running_loop()
+        client.setblocking(False)
+        stream = MessageStream()
+        data = bytearray()
+        deadline = loop.time() + 10
+        try:
+            while loop.time() < deadline:
+                chunk = await asyncio.wait_for(loop.sock_recv(client, 4096), deadline - loop.time())
+                if not chunk:
+                    break
+                data += chunk
+                for kind, fields in stream.feed(chunk):
+                    if kind == "ENCODING":
+                        stream.codec = CODECS.get(fields[0], TEXT)
+                    elif kind == "SPECTATE":
+                        match_id = int(fields[0]) if fields[0].isdigit() else 1
+                        worker = self.workers[(match_id - 1) % len(self.workers)]
+                        self.hand_over(worker if worker.alive() else None, b"spectate " + data, client)
+                        return
+        except (asyncio.TimeoutError, OSError, ValueError):
+            pass
+        client.close()
+
+    def on_control(self, worker):
+        try:
+            message, fds, _, _ = socket.recv_fds(worker.control, 1 << 20, 1)
+        except BlockingIOError:
+            return
+        except OSError:
+            message, fds = b"", []
+        if not message:
+            asyncio.get_running_loop().remove_reader(worker.control)
+            return  # The worker is gone, monitor() starts it again
+        kind, _, rest = message.partition(b" ")
+        if kind == b"lobby":
+            joined, seats = map(int, rest.split())
+            if joined == worker.sent:
+                # Reports sent while a handoff was still on its way are outdated
+                worker.seats = seats
+        elif kind == b"stats":
+            worker.metrics = json.loads(rest)
+            worker.reported = time.monotonic()
+        elif kind == b"resume" and fds:
+            owner, _, rest = rest.partition(b" ")
+            target = self.workers[int(owner)]
+            self.hand_over(target if target.alive() else None, b"resume " + rest, socket.socket(fileno=fds[0]))
+        else:
+            for fd in fds:
+                os.close(fd)
+
+    async def monitor(self):
+        # Restarts workers that exited, marks those that stopped reporting, sums up their metrics
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            now = time.monotonic()
+            for worker in self.workers:
+                if not worker.alive():
+                    log.warning("Worker %s exited with code %s, starting it again",
+                                worker.index + 1, worker.process.returncode)
+                    loop.remove_reader(worker.control)
+                    worker.control.close()
+                    worker.start()
+                    loop.add_reader(worker.control, self.on_control, worker)
+                    RESTARTS.inc(1, worker.index)
+                WORKERS_UP.set(int(now - worker.reported < 3 * REPORT_INTERVAL), worker.index)
+            metrics.merge(worker.metrics for worker in self.workers)
+
+    def stats_line(self):
+        up = sum(1 for worker in self.workers if WORKERS_UP.values.get(worker.index))
+        return f"workers={up}/{len(self.workers)} handoffs={HANDOFFS.total()} {stats_line()}"
+
+    def listen(self, port):
+        listener = socket.create_server((self.host, port), backlog=1024)
+        listener.setblocking(False)
+        return listener
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        listener = self.listen(self.port)
+        for worker in self.workers:
+            worker.start()
+            loop.add_reader(worker.control, self.on_control, worker)
+        loop.add_reader(listener, self.accept_players, listener)
+        log.info("Supervisor started with %s workers, waiting for players to connect...", len(self.workers))
+        if self.spectator_port:
+            spectator_listener = self.listen(self.spectator_port)
+            loop.add_reader(spectator_listener, self.accept_spectators, spectator_listener)
+            log.info("Spectators on port %s", self.spectator_port)
+        if self.metrics_port:
+            metrics.metrics += cluster.metrics
+            await serve_metrics(metrics, "127.0.0.1", self.metrics_port)
+            log.info("Metrics on http://127.0.0.1:%s/metrics", self.metrics_port)
+        if self.stats_interval:
+            self.stats_task = asyncio.create_task(log_stats(log, self.stats_interval, self.stats_line))
+        try:
+            await self.monitor()
+        finally:
+            for worker in self.workers:
+                worker.process.terminate()
+            for worker in self.workers:
+                worker.process.wait()
+
+    def start(self):
+        asyncio.run(self.serve())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schiffe versenken server")
+    parser.add_argument("--host", default='192.168.5.143')
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this local port")
+    parser.add_argument("--stats-interval", type=float, default=None, help="log a stats line every N seconds")
+    parser.add_argument("--size", type=int, default=10, help="rows and columns of the board")
+    parser.add_argument("--fleet", default=None, help='ships as "4:Flugzeugträger,3:Kreuzer,..." or sizes "5,4,3,3,2"')
+    parser.add_argument("--no-touching", action="store_true", help="ships may not touch, not even diagonally")
+    parser.add_argument("--event-log", default=None,
+                        help="append every placement and shot to this file, older segments go to FILE.1, FILE.2, ...")
+    parser.add_argument("--spectator-port", type=int, default=None, help="accept SPECTATE connections on this port")
+    parser.add_argument("--spectator-queue", type=int, default=65536, help="bytes a spectator may fall behind")
+    parser.add_argument("--lag-policy", choices=["snapshot", "drop"], default="snapshot",
+                        help="what happens to a spectator that falls further behind")
+    parser.add_argument("--resume-timeout", type=float, default=60.0,
+                        help="seconds a started match waits for a disconnected player, 0 ends it at once")
+    parser.add_argument("--heartbeat", type=float, default=10.0, help="seconds between PINGs, 0 disables reaping")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes behind one port, 0 for one per core")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)  # index/count, set by the supervisor
+    parser.add_argument("--control-fd", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--log-rate", type=float, default=10.0, help="log records per second per message")
+    args = parser.parse_args()
+
+    setup_logging(args.log_level, args.log_rate)
+    config = GameConfig(args.size, GameConfig.parse_fleet(args.fleet) if args.fleet else CLIENT_FLEET, not args.no_touching)
+    if args.worker is None and args.workers != 1:
+        supervisor = Supervisor(args.workers or os.cpu_count(), sys.argv[1:], args.host, args.port, args.metrics_port,
+                                args.stats_interval, args.spectator_port)
+        supervisor.start()
+    else:
+        worker = control = None
+        event_log = args.event_log
+        if args.worker is not None:
+            worker = tuple(map(int, args.worker.split("/")))
+            control = socket.socket(fileno=args.control_fd)
+            if event_log:
+                event_log = f"{event_log}.{worker[0]}"  # One log per worker, the analytics take them all
+        server = BattleshipServer(args.host, args.port, args.metrics_port, args.stats_interval, config, event_log,
+                                  args.spectator_port, args.spectator_queue, args.lag_policy,
+                                  args.resume_timeout, args.heartbeat, worker, control)
+        server.start()
@@ -0,0 +1,116 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from SchiffeVersenkenEngine import CLIENT_FLEET, DEFAULT_FLEET, Game, random_fleet
+from SchiffeVersenkenStrategies import STRATEGIES
+
+FLEETS = {"tk": DEFAULT_FLEET, "client": CLIENT_FLEET}
+STRATEGY_NAMES = sorted([*STRATEGIES, "probability"])
+
+
+def strategy(name):
+    if name == "probability":
+        # Imported here: the AI needs NumPy, the other strategies do not
+        from SchiffeVersenkenAI import ProbabilityStrategy
+        return ProbabilityStrategy
+    return STRATEGIES[name]
+
+
+def play_game(strategies, fleet=DEFAULT_FLEET, size=10, seed=0):
+    # Plays one headless game, returns (winner, shots fired by the winner)
+    rng = random.Random(seed)
+    game = Game(size)
+    game.boards = [random_fleet(fleet, size, rng), random_fleet(fleet, size, rng)]
+    game.current_player = seed % 2  # Alternate who opens the game
+    players = [strategy(size, random.Random(rng.random()), fleet) for strategy in strategies]
+    shots = [0, 0]
+    while game.winner is None:
+        player = game.current_player
+        row, col = players[player].next_shot()
+        hit, sunk, _ = game.shoot(player, row, col)
+        players[player].observe(row, col, hit, sunk)
+        shots[player] += 1
+    return game.winner, shots[game.winner]
+
+
+class Results:
+    # Running totals, so no single game has to be kept around
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0]
+        self.shots_to_win = [0, 0]
+
+    def add(self, winner, shots):
+        self.games += 1
+        self.wins[winner] += 1
+        self.shots_to_win[winner] += shots
+
+    def merge(self, other):
+        self.games += other.games
+        for player in (0, 1):
+            self.wins[player] += other.wins[player]
+            self.shots_to_win[player] += other.shots_to_win[player]
+
+    def summary(self, names):
+        parts = []
+        for player in (0, 1):
+            wins = self.wins[player]
+            rate = wins / self.games if self.games else 0
+            mean = self.shots_to_win[player] / wins if wins else 0
+            parts.append(f"{names[player]}: {rate:.1%} wins, {mean:.1f} shots to win")
+        return f"{self.games} games | " + " | ".join(parts)
+
+
+def run_chunk(names, fleet_name, size, first_seed, count):
+    strategies = [strategy(names[0]), strategy(names[1])]
+    fleet = FLEETS[fleet_name]
+    results = Results()
+    for seed in range(first_seed, first_seed + count):
+        results.add(*play_game(strategies, fleet, size, seed))
+    return results
+
+
+def run(names, games, fleet_name="tk", size=10, seed=0, workers=None, chunk=1000, progress=None):
+    # Spreads the games over a process pool in chunks of consecutive seeds and merges results as they arrive
+    total = Results()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_chunk, names, fleet_name, size, seed + start, min(chunk, games - start))
+                   for start in range(0, games, chunk)]
+        for future in as_completed(futures):
+            total.merge(future.result())
+            if progress:
+                progress(total)
+    return total
+
+
+def scaling(names, games, fleet_name, size, seed, chunk):
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        start = time.perf_counter()
+        run(names, games, fleet_name, size, seed, workers, chunk)
+        elapsed = time.perf_counter() - start
+        print(f"{workers} worker(s): {games / elapsed:.0f} games/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Schiffe versenken simulation between shooting strategies")
+    parser.add_argument("strategies", nargs=2, choices=STRATEGY_NAMES)
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--fleet", choices=sorted(FLEETS), default="tk")
+    parser.add_argument("--size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--scaling", action="store_true", help="report games/sec from 1 worker up to all cores")
+    args = parser.parse_args()
+
+    if args.scaling:
+        scaling(args.strategies, args.games, args.fleet, args.size, args.seed, args.chunk)
+    else:
+        start = time.perf_counter()
+        results = run(args.strategies, args.games, args.fleet, args.size, args.seed, args.workers, args.chunk,
+                      progress=lambda total: print(total.summary(args.strategies), flush=True))
+        elapsed = time.perf_counter() - start
+        print(f"{results.games / elapsed:.0f} games/sec")
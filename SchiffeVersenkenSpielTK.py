@@ -1,10 +1,14 @@
+import argparse
+import random
 import tkinter as tk
 from tkinter import messagebox
 
+from SchiffeVersenkenEngine import DEFAULT_FLEET, Board, Game, GameConfig, fleet_sampler, line_cells
+
 
 
 class ShipGamePlayer(tk.Tk):
-    def __init__(self, size=10, ships=[(4, "Flugzeugträger"), (3, "Schlachtschiff"), (2, "U-Boot"), (1, "Fischerboot")], player=1, placement_callback=None):
+    def __init__(self, size=10, ships=DEFAULT_FLEET, player=1, placement_callback=None, adjacent=True, profile=None):
         super().__init__()
         self.size = size
         self.ships = ships
@@ -14,7 +18,9 @@ class ShipGamePlayer(tk.Tk):
         self.current_ship_size, self.current_ship_name = self.ships[self.current_ship_index]
         self.placedships_board = [["O" for _ in range(self.size)] for _ in range(self.size)]
         self.ship_positions = {name: [] for _, name in self.ships}
+        self.fleet = Board(self.size, adjacent)
         self.placement_callback = placement_callback
+        self.profile = profile  # Profile from recorded games for the random fleet, None samples uniformly
         self.create_widgets()
 
     def create_widgets(self):
@@ -30,41 +36,48 @@ class ShipGamePlayer(tk.Tk):
         self.info_label = tk.Label(self, text=f"Platziere dein {self.current_ship_name} ({self.current_ship_size} Felder)")
         self.info_label.grid(row=self.size, columnspan=self.size)
 
+        self.random_button = tk.Button(self, text="Zufällige Flotte", command=self.place_random_fleet)
+        self.random_button.grid(row=self.size + 1, columnspan=self.size)
+
     def place_ship(self, x, y):
         if self.can_place_ship(self.current_ship_size, x, y):
             self.mark_ship(self.current_ship_size, x, y)
             self.next_ship()
 
+    def ship_cells(self, size, x, y):
+        # Ships go downwards from the clicked cell, or to the right if they do not fit
+        for vertical in (True, False):
+            if self.fleet.can_place_line(x, y, size, vertical):
+                return line_cells(x, y, size, vertical)
+        return None
+
     def can_place_ship(self, size, x, y):
-        if x + size <= self.size:
-            for i in range(size):
-                if self.placedships_board[x + i][y] != "O":
-                    return False
-            return True
-        elif y + size <= self.size:
-            for i in range(size):
-                if self.placedships_board[x][y + i] != "O":
-                    return False
-            return True
-        return False
+        return self.ship_cells(size, x, y) is not None
+
+    def place_random_fleet(self):
+        # Places every ship not placed yet at random around the ones already on the board
+        remaining = tuple(self.ships[self.current_ship_index:])
+        sampler = fleet_sampler(remaining, self.size, self.fleet.adjacent)
+        if self.profile:
+            ships = self.profile.safest_fleet(sampler, blocked=self.fleet.blocked)
+        else:
+            ships = sampler.sample(blocked=self.fleet.blocked)
+        if ships is None:
+            messagebox.showinfo("Fehler!", "Die restlichen Schiffe passen nicht mehr auf das Feld.")
+            return
+        for positions in ships:
+            self.mark_cells(positions)
+            self.next_ship()
 
     def mark_ship(self, size, x, y):
-        positions = []
-        for i in range(size):
-            if x + size <= self.size:
-                self.placedships_board[x + i][y] = "S"
-                self.buttons[x + i][y].config(bg="red" if self.player == 1 else "blue")
-                positions.append((x + i, y))
-            elif y + size <= self.size:
-                self.placedships_board[x][y + i] = "S"
-                self.buttons[x][y + i].config(bg="red" if self.player == 1 else "blue")
-                positions.append((x, y + i))
+        self.mark_cells(self.ship_cells(size, x, y))
+
+    def mark_cells(self, positions):
+        self.fleet.add_ship(positions, self.current_ship_name)
+        for i, j in positions:
+            self.placedships_board[i][j] = "S"
+            self.buttons[i][j].config(bg="red" if self.player == 1 else "blue")
         self.ship_positions[self.current_ship_name] = positions
-        if all(len(row) == self.size and row.count("S") == size for row in self.placedships_board):
-            messagebox.showinfo("Fertig!", f"Spieler {self.player} hat alle Schiffe platziert.")
-            self.destroy()
-            if self.placement_callback:
-                self.placement_callback(self.player, self.placedships_board, self.ship_positions)
 
     def next_ship(self):
         self.current_ship_index += 1
@@ -79,130 +92,131 @@ class ShipGamePlayer(tk.Tk):
 
 
 class GamePhase:
-    def __init__(self, size=10, player1_board=None, player2_board=None, player1_ships=None, player2_ships=None):
+    # Thin Tk view on the headless Game: one window for the whole match, only changed cells are redrawn
+    hit_colors = {1: "red", 2: "blue"}  # Color of hits on the board of player 1 and player 2
+
+    def __init__(self, size=10, player1_ships=None, player2_ships=None, ai_player=None, adjacent=True, profile=None):
         self.size = size
-        self.player1_board = player1_board
-        self.player2_board = player2_board
-        self.player1_ships = player1_ships
-        self.player2_ships = player2_ships
+        self.game = Game(size, adjacent)
+        self.game.place_fleet(0, player1_ships)
+        self.game.place_fleet(1, player2_ships)
         self.current_player = 1
-        self.player1_hits = 0
-        self.player2_hits = 0
+        self.player_guess_window = None
+        self.buttons = []
+        self.shown = {}  # (x, y) -> color currently drawn on the guess board
+        self.ai_player = ai_player
+        if ai_player is not None:
+            # Imported here: the AI needs NumPy, two players at one screen do not
+            from SchiffeVersenkenAI import ProbabilityStrategy
+            opponent_ships = player2_ships if ai_player == 1 else player1_ships
+            fleet = [(len(cells), name) for name, cells in opponent_ships.items()]
+            prior = profile.target_prior() if profile else None
+            self.ai = ProbabilityStrategy(size, random.Random(), fleet, prior)
 
     def start_game(self):
+        self.player_guess_window = tk.Tk()
+        self.create_guess_board(self.player_guess_window)
         self.start_player_turn()
+        self.player_guess_window.mainloop()
 
     def start_player_turn(self):
-        if self.current_player == 1:
-            self.player_guess_window = tk.Tk()
-            self.player_guess_window.title("Spieler 1: Schiffe erraten")
-            self.create_guess_board(self.player_guess_window, self.player2_board, self.player1_turn)
-        else:
-            self.player_guess_window = tk.Tk()
-            self.player_guess_window.title("Spieler 2: Schiffe erraten")
-            self.create_guess_board(self.player_guess_window, self.player1_board, self.player2_turn)
-        self.player_guess_window.mainloop()
+        self.player_guess_window.title(f"Spieler {self.current_player}: Schiffe erraten")
+        self.redraw(3 - self.current_player)
+        if self.current_player == self.ai_player:
+            self.player_guess_window.after(300, self.ai_turn)
 
-    def player1_turn(self, x, y, btn):
-        if self.player2_board[x][y] == "S":
-            btn.config(bg="blue")
-            messagebox.showinfo("Treffer!", "Versenkt!")
-            self.player2_board[x][y] = "H"
-            self.player1_hits += 1
-            ship_name = self.check_sunk_ship(x, y, self.player2_ships)
-            if ship_name:
-                messagebox.showinfo("Versenkt!", f"{ship_name} versenkt!")
-            if self.check_win(self.player1_hits):
-                messagebox.showinfo("Spieler 1 gewinnt!", "Alle Schiffe von Spieler 2 sind versenkt!")
-                self.player_guess_window.destroy()
-            else:
-                self.current_player = 1  # Player 1 geht weiter
-                self.player_guess_window.destroy()
-                self.start_player_turn()
-        elif self.player2_board[x][y] == "O":
-            btn.config(bg="black")
-            messagebox.showinfo("Fehler!", "Verfehlt")
-            self.player2_board[x][y] = "M"  # als Verfehlt markieren
-            self.current_player = 2  # player 2 geht weiter
-            self.player_guess_window.destroy()
-            self.start_player_turn()
-
-    def player2_turn(self, x, y, btn):
-        if self.player1_board[x][y] == "S":
-            btn.config(bg="red")
+    def ai_turn(self):
+        x, y = self.ai.next_shot()
+        self.guess(x, y, from_ai=True)
+
+    def create_guess_board(self, window):
+        for i in range(self.size):
+            row_buttons = []
+            for j in range(self.size):
+                btn = tk.Button(window, text="", width=2, height=1, command=lambda x=i, y=j: self.guess(x, y))
+                btn.grid(row=i, column=j)
+                row_buttons.append(btn)
+            self.buttons.append(row_buttons)
+        self.default_color = self.buttons[0][0].cget("bg")
+
+    def cell_colors(self, target):
+        board = self.game.boards[target - 1]
+        return {pos: self.hit_colors[target] if pos in board.cells else "black" for pos in board.shots}
+
+    def redraw(self, target):
+        # Switch the guess board to the shots on player target's fleet, touching only cells that differ
+        colors = self.cell_colors(target)
+        for pos in [pos for pos in self.shown if pos not in colors]:
+            del self.shown[pos]
+            self.buttons[pos[0]][pos[1]].config(bg=self.default_color)
+        for pos, color in colors.items():
+            if self.shown.get(pos) != color:
+                self.shown[pos] = color
+                self.buttons[pos[0]][pos[1]].config(bg=color)
+
+    def guess(self, x, y, from_ai=False):
+        target = 3 - self.current_player
+        if (x, y) in self.game.boards[target - 1].shots or (self.current_player == self.ai_player) != from_ai:
+            return
+        hit, ship_name, won = self.game.shoot(self.current_player - 1, x, y)
+        if from_ai:
+            self.ai.observe(x, y, hit, ship_name)
+        self.redraw(target)
+        if hit:
             messagebox.showinfo("Treffer!", "Versenkt!")
-            self.player1_board[x][y] = "H"
-            self.player2_hits += 1
-            ship_name = self.check_sunk_ship(x, y, self.player1_ships)
             if ship_name:
                 messagebox.showinfo("Versenkt!", f"{ship_name} versenkt!")
-            if self.check_win(self.player2_hits):
-                messagebox.showinfo("Spieler 2 gewinnt!", "Alle Schiffe von Spieler 1 sind versenkt!")
+            if won:
+                messagebox.showinfo(f"Spieler {self.current_player} gewinnt!", f"Alle Schiffe von Spieler {target} sind versenkt!")
                 self.player_guess_window.destroy()
-            else:
-                self.current_player = 2  # Spieler 2 geht weiter
-                self.player_guess_window.destroy()
-                self.start_player_turn()
-        elif self.player1_board[x][y] == "O":
-            btn.config(bg="black")
+                return
+        else:
             messagebox.showinfo("Fehler!", "Verfehlt")
-            self.player1_board[x][y] = "M"  # Mark as miss 
-            self.current_player = 1  # Spielerwechsel
-            self.player_guess_window.destroy()
-            self.start_player_turn()
-
-    def create_guess_board(self, window, board, turn_callback):
-        for i in range(self.size):
-            for j in range(self.size):
-                btn = tk.Button(window, text="", width=2, height=1)
-                btn.grid(row=i, column=j)
-                if board[i][j] == "H":
-                    if board == self.player2_board:
-                        btn.config(bg="blue")
-                    else:
-                        btn.config(bg="red")
-                elif board[i][j] == "M":
-                    btn.config(bg="black")
-                else:
-                    btn.config(command=lambda x=i, y=j, b=btn: turn_callback(x, y, b))
-
-    def check_win(self, hits):
-        total_ship_cells = sum(ship[0] for ship in [(4, "Flugzeugträger"), (3, "Schlachtschiff"), (2, "U-Boot"), (1, "Fischerboot")])
-        return hits == total_ship_cells
-
-    def check_sunk_ship(self, x, y, ships):
-        for ship_name, coordinates in ships.items():
-            if (x, y) in coordinates:
-                coordinates.remove((x, y))
-                if not coordinates:
-                    return ship_name
-        return None
+        self.current_player = self.game.current_player + 1
+        self.start_player_turn()
 
 
 if __name__ == "__main__":
-    player1_board = []
-    player2_board = []
+    parser = argparse.ArgumentParser(description="Schiffe versenken für zwei Spieler an einem Rechner")
+    parser.add_argument("--ai", action="store_true", help="Spieler 2 ist der Computer")
+    parser.add_argument("--size", type=int, default=10, help="Zeilen und Spalten des Spielfelds")
+    parser.add_argument("--fleet", default=None, help='Schiffe als "4:Flugzeugträger,3:Schlachtschiff,..." oder nur Größen "5,4,3,3,2"')
+    parser.add_argument("--no-touching", action="store_true", help="Schiffe dürfen sich nicht berühren, auch nicht diagonal")
+    parser.add_argument("--profile", default=None, help="Auswertung aufgezeichneter Spiele (SchiffeVersenkenAnalytics.py --out)")
+    args = parser.parse_args()
+    config = GameConfig(args.size, GameConfig.parse_fleet(args.fleet) if args.fleet else DEFAULT_FLEET, not args.no_touching)
+    profile = None
+    if args.profile:
+        # Imported here: the analytics need NumPy, playing without a profile does not
+        from SchiffeVersenkenAnalytics import Profile
+        profile = Profile.load(args.profile).get(config.size)
+
     player1_ships = {}
     player2_ships = {}
 
     def start_game_phase(player, board, ships):
-        global player1_board, player2_board, player1_ships, player2_ships
+        # The character board is only for ShipGamePlayer, the game keeps its own bitboards
+        global player1_ships, player2_ships
         if player == 1:
-            player1_board = board
             player1_ships = ships
             start_ship_placement_for_player2()
         elif player == 2:
-            player2_board = board
             player2_ships = ships
-            game_phase = GamePhase(size=10, player1_board=player1_board, player2_board=player2_board, player1_ships=player1_ships, player2_ships=player2_ships)
+            game_phase = GamePhase(size=config.size, player1_ships=player1_ships, player2_ships=player2_ships, ai_player=2 if args.ai else None, adjacent=config.adjacent, profile=profile)
             game_phase.start_game()
 
     def start_ship_placement_for_player2():
-        player2 = ShipGamePlayer(player=2, placement_callback=start_game_phase)
+        if args.ai:
+            # The computer places its fleet at random instead of opening a placement window
+            sampler = fleet_sampler(tuple(config.fleet), config.size, config.adjacent)
+            ships = profile.safest_fleet(sampler) if profile else sampler.sample()
+            start_game_phase(2, None, {name: cells for (_, name), cells in zip(config.fleet, ships)})
+            return
+        player2 = ShipGamePlayer(config.size, config.fleet, player=2, placement_callback=start_game_phase, adjacent=config.adjacent, profile=profile)
         player2.mainloop()
 
     def start_ship_placement_for_player1():
-        player1 = ShipGamePlayer(player=1, placement_callback=start_game_phase)
+        player1 = ShipGamePlayer(config.size, config.fleet, player=1, placement_callback=start_game_phase, adjacent=config.adjacent, profile=profile)
         player1.mainloop()
 
     start_ship_placement_for_player1()
@@ -0,0 +1,58 @@
+from SchiffeVersenkenEngine import DEFAULT_FLEET
+
+
+class RandomStrategy:
+    # Fires at every cell exactly once in random order
+    name = "random"
+
+    def __init__(self, size, rng, fleet=DEFAULT_FLEET):
+        self.size = size
+        self.rng = rng
+        self.untried = [(r, c) for r in range(size) for c in range(size)]
+        rng.shuffle(self.untried)
+        self.shot = set()
+
+    def next_shot(self):
+        while True:
+            pos = self.untried.pop()
+            if pos not in self.shot:
+                return pos
+
+    def observe(self, row, col, hit, sunk):
+        self.shot.add((row, col))
+
+
+class HuntTargetStrategy(RandomStrategy):
+    # Random shots until something is hit, then the neighbors of every hit
+    name = "hunt"
+
+    def __init__(self, size, rng, fleet=DEFAULT_FLEET):
+        super().__init__(size, rng, fleet)
+        self.targets = []
+
+    def next_shot(self):
+        while self.targets:
+            pos = self.targets.pop()
+            if pos not in self.shot:
+                return pos
+        return super().next_shot()
+
+    def observe(self, row, col, hit, sunk):
+        self.shot.add((row, col))
+        if hit:
+            for r, c in ((row + 1, col), (row - 1, col), (row, col + 1), (row, col - 1)):
+                if 0 <= r < self.size and 0 <= c < self.size and (r, c) not in self.shot:
+                    self.targets.append((r, c))
+
+
+class ParityStrategy(HuntTargetStrategy):
+    # Like hunt, but searches a checkerboard first: every ship longer than one cell covers a black field
+    name = "parity"
+
+    def __init__(self, size, rng, fleet=DEFAULT_FLEET):
+        super().__init__(size, rng, fleet)
+        # Cells are popped from the end, so the checkerboard goes last
+        self.untried.sort(key=lambda pos: (pos[0] + pos[1]) % 2 == 0)
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (RandomStrategy, HuntTargetStrategy, ParityStrategy)}
@@ -0,0 +1,57 @@
+import random
+
+from SchiffeVersenkenAnalytics import analyze, byte_ranges, finished_matches
+from SchiffeVersenkenEngine import DEFAULT_FLEET, GameConfig, fleet_sampler
+from SchiffeVersenkenEventLog import EventLog, find_record, open_log, read_records
+
+
+def write_archive(path, matches=40, in_parallel=5):
+    # Matches that overlap in the log, the way a server with many tables writes it
+    rng = random.Random(1)
+    config = GameConfig()
+    sampler = fleet_sampler(tuple(DEFAULT_FLEET), config.size)
+    journal = EventLog(path, sync=False)
+    cells = [(row, col) for row in range(config.size) for col in range(config.size)]
+    playing = {}
+    next_id = 1
+    while next_id <= matches or playing:
+        if next_id <= matches and len(playing) < in_parallel:
+            journal.match_started(next_id, config)
+            journal.fleet(next_id, 0, sampler.sample(rng))
+            journal.fleet(next_id, 1, sampler.sample(rng))
+            playing[next_id] = rng.sample(cells, rng.randrange(5, 30))
+            next_id += 1
+            continue
+        match_id = rng.choice(list(playing))
+        shots = playing[match_id]
+        if shots:
+            row, col = shots.pop()
+            journal.shot(match_id, len(shots) % 2, row, col)
+        else:
+            del playing[match_id]
+            journal.match_ended(match_id, match_id % 2)
+    journal.close()
+
+
+def test_find_record_lands_on_boundaries(tmp_path):
+    path = str(tmp_path / "events.log")
+    write_archive(path)
+    buffer = open_log(path)
+    boundaries = [0] + [after for *_, after in read_records(buffer)]
+    for start in range(0, len(buffer), 7):
+        assert find_record(buffer, start) == min(b for b in boundaries if b >= start)
+
+
+def test_byte_ranges_count_every_match_once(tmp_path):
+    path = str(tmp_path / "events.log")
+    write_archive(path)
+    whole = sorted(tuple(shots) for _, _, shots, _ in finished_matches(path))
+    pieces = byte_ranges([path], 16, chunk=256)
+    assert len(pieces) > 1
+    split = sorted(tuple(shots) for piece in pieces for _, _, shots, _ in finished_matches(*piece))
+    assert len(whole) == 40 and split == whole
+
+    single = analyze([path])[10]
+    parallel = analyze([path], workers=2, chunk=256)[10]
+    assert parallel.games == single.games
+    assert (parallel.shots == single.shots).all() and (parallel.hits == single.hits).all()
@@ -0,0 +1,50 @@
+import random
+
+from SchiffeVersenkenEngine import CLIENT_FLEET, FleetSampler, Game, GameConfig
+
+
+def test_legacy_comma_only_fleet_is_accepted():
+    # The baseline client sends all cells in one comma list, ship after ship
+    config = GameConfig(10, CLIENT_FLEET)
+    ships = config.parse_ships("0:0,1:0,2:0,3:0,0:2,1:2,2:2,0:4,1:4,0:6")
+    assert ships == [[(0, 0), (1, 0), (2, 0), (3, 0)], [(0, 2), (1, 2), (2, 2)], [(0, 4), (1, 4)], [(0, 6)]]
+    assert config.validate(ships) is None
+
+
+def test_legacy_fleet_with_ships_end_to_end():
+    config = GameConfig(10, CLIENT_FLEET)
+    ships = config.parse_ships("0:0,1:0,2:0,3:0,4:0,5:0,6:0,0:4,0:5,0:8")
+    assert [len(cells) for cells in ships] == [4, 3, 2, 1]
+    assert config.validate(ships) is None
+
+
+def test_separated_fleet_is_parsed_as_sent():
+    config = GameConfig(10, CLIENT_FLEET)
+    ships = config.parse_ships("0:0,1:0,2:0,3:0;0:2,1:2,2:2;0:4,1:4;0:6")
+    assert len(ships) == 4 and config.validate(ships) is None
+
+
+def test_sampler_is_exact_even_when_dense():
+    dense = FleetSampler(GameConfig.parse_fleet("4,3,3,2,2,2,1,1,1,1"), 10, adjacent=False)
+    rng = random.Random(3)
+    ships = dense.sample(rng)
+    assert ships is not None and GameConfig(10, dense.fleet, False).validate(ships) is None
+    assert ships != dense._sequential(random.Random(3), 0)
+
+
+def test_sampler_gives_up_when_nothing_fits():
+    sampler = FleetSampler(CLIENT_FLEET, 10)
+    blocked = (1 << 100) - 1 - 0b111  # Only three cells free, the fleet needs ten
+    assert sampler.sample(random.Random(1), blocked, tries=1000) is None
+
+
+def test_game_rejects_cells_already_shot():
+    game = Game(10)
+    game.place_fleet(0, [[(0, 0)]])
+    game.place_fleet(1, [[(5, 5), (5, 6)]])
+    assert game.shoot(0, 5, 5) == (True, None, False)
+    assert game.shoot(0, 5, 5) is None
+    assert game.shoot(0, 1, 1) == (False, None, False)
+    assert game.shoot(1, 9, 9) == (False, None, False)
+    assert game.shoot(0, 1, 1) is None
+    assert game.current_player == 0
@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+from SchiffeVersenkenAnalytics import finished_matches
+from SchiffeVersenkenEngine import GameConfig
+from SchiffeVersenkenEventLog import CHECKPOINT, EventLog, open_log, read_records, recover
+
+FLEETS = [[[(0, 0), (0, 1)]], [[(5, 5)]]]
+
+
+def start_match(journal, match_id):
+    journal.match_started(match_id, GameConfig())
+    for player, ships in enumerate(FLEETS):
+        journal.fleet(match_id, player, ships)
+
+
+def test_restart_starts_a_segment_with_the_matches_in_play(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventLog(path, sync=False)
+    for match_id in (1, 2, 3):
+        start_match(journal, match_id)
+    journal.shot(1, 0, 9, 9)
+    journal.match_ended(2, 0)
+    journal.close()
+
+    journal = EventLog(path, sync=False)
+    assert journal.archived == path + ".1"
+    assert sorted(journal.recovered) == [1, 3]
+    journal.close()
+    kinds = [kind for kind, *_ in read_records(open_log(path))]
+    assert kinds[0] == CHECKPOINT and len(kinds) == 3
+    matches, last_id, _ = recover(path)
+    assert last_id == 3 and matches[1].game.boards[1].shots == {(9, 9)}
+
+    # Nothing happened since, so the next start keeps the segment
+    journal = EventLog(path, sync=False)
+    assert journal.archived is None and sorted(journal.recovered) == [1, 3]
+    journal.match_ended(1, 0)
+    journal.match_ended(3, 1)
+    journal.close()
+    assert EventLog(path, sync=False).last_match_id == 3
+    assert not os.path.exists(path + ".3")
+
+
+def test_segment_outgrowing_its_size_is_rotated(tmp_path):
+    path = str(tmp_path / "events.log")
+
+    async def run():
+        journal = EventLog(path, sync=False, segment_bytes=256)
+        start_match(journal, 1)
+        for row in range(5):
+            journal.shot(1, 0, row, 9)
+            journal.shot(1, 1, row, 8)
+        start_match(journal, 2)
+        await journal.commit()
+        journal.match_ended(2, 1)
+        journal.close()
+
+    asyncio.run(run())
+    assert os.path.exists(path + ".1")
+    matches, last_id, _ = recover(path)
+    assert list(matches) == [1] and last_id == 2
+    assert len(matches[1].game.boards[1].shots) == 5
+
+
+def test_interrupted_rotation_is_finished_on_start(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventLog(path, sync=False)
+    start_match(journal, 1)
+    journal.close()
+    os.rename(path, path + ".new")
+    assert list(EventLog(path, sync=False).recovered) == [1]
+
+
+def test_analytics_count_a_match_across_segments_once(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventLog(path, sync=False)
+    start_match(journal, 1)
+    journal.shot(1, 0, 5, 5)
+    journal.close()
+    journal = EventLog(path, sync=False)
+    journal.shot(1, 1, 0, 0)
+    journal.shot(1, 1, 0, 1)
+    journal.match_ended(1, 1)
+    journal.close()
+    games = [game for archive in (path + ".1", path) for game in finished_matches(archive)]
+    assert len(games) == 1
+    size, fleets, shots, winner = games[0]
+    assert winner == 1 and fleets == FLEETS and sorted(shots) == [(0, 5, 5), (1, 0, 0), (1, 0, 1)]
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+from SchiffeVersenkenLoadTest import ProcessSampler
+
+
+def test_sampler_counts_child_processes():
+    sampler = ProcessSampler(os.getpid())
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        assert child.pid in sampler.processes()
+        sampler.sample()
+        alone = ProcessSampler(child.pid)
+        alone.sample()
+        assert sampler.peak_rss > alone.peak_rss > 0
+    finally:
+        child.kill()
+        child.wait()
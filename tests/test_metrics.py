@@ -0,0 +1,20 @@
+from SchiffeVersenkenMetrics import Registry
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("messages_total", "Messages", "type")
+    counter.inc(1, 'evil"kind\\x\n')
+    assert 'messages_total{type="evil\\"kind\\\\x\\n"} 1' in registry.render()
+
+
+def test_merge_adds_up_dumps():
+    worker = Registry()
+    worker.counter("messages_total", "Messages", "type").inc(2, "GUESS")
+    worker.histogram("seconds", "Seconds").observe(0.001)
+    total = Registry()
+    counter = total.counter("messages_total", "Messages", "type")
+    histogram = total.histogram("seconds", "Seconds")
+    total.merge([worker.dump(), worker.dump()])
+    assert counter.values == {"GUESS": 4}
+    assert histogram.total() == 2
@@ -0,0 +1,77 @@
+import pytest
+
+from SchiffeVersenkenProtocol import BINARY, MAX_FRAME, TEXT, MessageStream
+
+MESSAGES = [
+    ("PLAYER_ID", ["1"]),
+    ("COLOR", ["blue"]),
+    ("WELCOME", ["Welcome Player 1"]),
+    ("SHIP_POSITIONS", ["0:0,1:0,2:0,3:0;0:2,1:2,2:2;0:4,1:4;0:6"]),
+    ("OPPONENT_SHIP_POSITIONS", ["0:0,0:1;5:5"]),
+    ("TURN", ["YES"]),
+    ("GUESS", ["3", "7"]),
+    ("RESULT", ["3", "7", "HIT"]),
+    ("HIT_ON_SHIP", ["4", "2"]),
+    ("MISS_ON_SHIP", ["9", "0"]),
+    ("WIN", ["NO"]),
+    ("SHOT", ["1", "3", "7", "MISS"]),
+    ("TURN_OF", ["0"]),
+    ("RESUME", ["0-abcdef:12"]),
+    ("RESYNC", ["3|10|100400|0|0|80"]),
+]
+
+
+def decode_all(codec, data):
+    stream = MessageStream()
+    stream.codec = codec
+    return [(kind, [str(field) for field in fields]) for kind, fields in stream.feed(data)]
+
+
+@pytest.mark.parametrize("codec", [TEXT, BINARY])
+def test_round_trip(codec):
+    data = b"".join(codec.encode(kind, fields) for kind, fields in MESSAGES)
+    assert decode_all(codec, data) == MESSAGES
+
+
+@pytest.mark.parametrize("codec", [TEXT, BINARY])
+def test_messages_split_across_reads(codec):
+    data = b"".join(codec.encode(kind, fields) for kind, fields in MESSAGES)
+    stream = MessageStream()
+    stream.codec = codec
+    received = []
+    for i in range(len(data)):
+        received += [(kind, [str(field) for field in fields]) for kind, fields in stream.feed(data[i:i + 1])]
+    assert received == MESSAGES
+
+
+def test_short_fixed_frame_does_not_reuse_stale_bytes():
+    stream = MessageStream()
+    stream.codec = BINARY
+    assert list(stream.feed(BINARY.encode("GUESS", (3, 7)))) == [("GUESS", [3, 7])]
+    with pytest.raises(ValueError):
+        list(stream.feed(bytes([1, 7])))
+
+
+@pytest.mark.parametrize("frame", [
+    bytes([1, 4]),  # SHIP_POSITIONS without a ship count
+    bytes([3, 4, 1, 2]),  # one ship of two cells, no cells
+    bytes([3, 6, 1, 1]),  # TURN flag followed by a stray byte in the same frame
+    bytes([0]),  # zero length frame
+])
+def test_malformed_binary_frames_raise_value_error(frame):
+    with pytest.raises(ValueError):
+        decode_all(BINARY, frame)
+
+
+def test_oversized_binary_frame_is_refused():
+    length = MAX_FRAME + 1
+    header = bytes([(length & 0x7f) | 0x80, (length >> 7 & 0x7f) | 0x80, length >> 14])
+    with pytest.raises(ValueError):
+        decode_all(BINARY, header)
+
+
+def test_endless_text_line_is_refused():
+    stream = MessageStream()
+    with pytest.raises(ValueError):
+        for _ in range(MAX_FRAME // 1024 + 2):
+            list(stream.feed(b"x" * 1024))
@@ -0,0 +1,163 @@
+import asyncio
+import importlib.util
+import os
+
+from SchiffeVersenkenEngine import GameConfig
+from SchiffeVersenkenEventLog import EventLog, recover
+from SchiffeVersenkenProtocol import TEXT, MessageStream
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SchiffeVersenkenServer .py")
+spec = importlib.util.spec_from_file_location("SchiffeVersenkenServer", SERVER_SCRIPT)
+server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(server)
+
+LEGACY_FLEET = "0:0,1:0,2:0,3:0,0:2,1:2,2:2,0:4,1:4,0:6"
+FLEET = "0:0,1:0,2:0,3:0;0:2,1:2,2:2;0:4,1:4;0:6"
+
+
+class Player:
+    # Collects what the match sends, as text lines like a socket would carry them
+    def __init__(self):
+        self.stream = MessageStream()
+        self.lines = []
+
+    def send(self, kind, *fields):
+        self.lines.append(TEXT.encode(kind, fields).decode().rstrip("\n"))
+
+
+def start_match(fleets):
+    match = server.Match(1)
+    players = [Player(), Player()]
+    for player in players:
+        match.join(player)
+    for player_id, fleet in enumerate(fleets):
+        match.handle_message(player_id, "SHIP_POSITIONS", [fleet])
+    return match, players
+
+
+def test_legacy_fleet_starts_the_game():
+    match, players = start_match([LEGACY_FLEET, FLEET])
+    assert match.started
+    assert not any(line.startswith("ERROR") for player in players for line in player.lines)
+
+
+def test_legacy_client_gets_comma_only_opponent_positions():
+    match, (legacy, current) = start_match([LEGACY_FLEET, FLEET])
+    assert f"OPPONENT_SHIP_POSITIONS:{LEGACY_FLEET}" in legacy.lines
+    assert f"OPPONENT_SHIP_POSITIONS:{FLEET}" in current.lines
+
+
+def test_unknown_message_kinds_share_one_label():
+    assert server.message_label("GUESS") == "GUESS"
+    assert server.message_label("ENCODING") == "ENCODING"
+    assert server.message_label('evil"kind') == "other"
+
+
+def test_unstarted_recovered_match_expires(tmp_path):
+    path = str(tmp_path / "events.log")
+    journal = EventLog(path)
+    journal.match_started(1, GameConfig())
+    journal.session(1, 0, "token")
+    journal.close()
+
+    async def run():
+        battleship = server.BattleshipServer(event_log=path, resume_timeout=0.01)
+        battleship.recover()
+        assert battleship.matches[1].expiry is not None
+        await asyncio.sleep(0.05)
+        assert not battleship.matches and not battleship.sessions
+        battleship.journal.close()
+
+    asyncio.run(run())
+    assert recover(path)[0] == {}
+
+
+class Transport:
+    def __init__(self):
+        self.aborted = False
+        self.written = b""
+
+    def abort(self):
+        self.aborted = True
+
+    def is_closing(self):
+        return self.aborted
+
+    def write(self, data):
+        self.written += data
+
+    def close(self):
+        self.aborted = True
+
+    def get_extra_info(self, name):
+        return None
+
+
+def test_reap_drops_only_players_that_answered_a_ping():
+    async def run():
+        battleship = server.BattleshipServer(heartbeat=0.01)
+        connections = []
+        for answered in (False, True):
+            connection = server.Connection(battleship)
+            connection.transport = Transport()
+            connection.answered = answered
+            battleship.connections.add(connection)
+            connections.append(connection)
+        task = asyncio.create_task(battleship.reap())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        return connections
+
+    legacy, answering = asyncio.run(run())
+    assert answering.transport.aborted
+    assert not legacy.transport.aborted and b"PING" in legacy.transport.written
+
+
+def test_repeated_guess_hands_the_turn_back():
+    match, players = start_match([FLEET, FLEET])
+    match.handle_message(0, "GUESS", ["9", "9"])
+    match.handle_message(1, "GUESS", ["9", "9"])
+    del players[0].lines[:]
+    del players[1].lines[:]
+    match.handle_message(0, "GUESS", ["9", "9"])
+    assert players[0].lines == ["ERROR:invalid guess", "TURN:YES"]
+    assert players[1].lines == []
+    assert match.game.current_player == 0
+
+
+def feed(connection, data):
+    connection.get_buffer(len(data))[:len(data)] = data
+    connection.buffer_updated(len(data))
+
+
+def test_resume_as_first_message_takes_no_lobby_seat(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "SEAT_DELAY", 0.01)
+
+    async def run():
+        battleship = server.BattleshipServer(event_log=str(tmp_path / "events.log"))
+        battleship.recover()
+        players = []
+        for _ in range(2):
+            connection = server.Connection(battleship)
+            connection.connection_made(Transport())
+            players.append(connection)
+        await asyncio.sleep(0.05)
+        match = players[0].match
+        assert match is players[1].match
+        for player_id, fleet in enumerate([FLEET, FLEET]):
+            feed(players[player_id], f"SHIP_POSITIONS:{fleet}\n".encode())
+        assert match.started
+        token = match.tokens[0]
+        players[0].connection_lost(None)
+
+        back = server.Connection(battleship)
+        back.connection_made(Transport())
+        feed(back, f"RESUME:{token}:0\n".encode())
+        await asyncio.sleep(0.05)
+        assert back.match is match and back.player_id == 0
+        assert list(battleship.matches) == [match.match_id] and not battleship.lobby
+        assert battleship.journal.last_match_id == match.match_id
+        assert battleship.joined == 3
+        battleship.journal.close()
+
+    asyncio.run(run())